@@ -2,6 +2,7 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from models import db, Student
+import migrations
 
 # Uncomment if you have these ML functions
 # from ml_model import predict_grade, ai_insights
@@ -16,6 +17,7 @@ db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    migrations.upgrade(db.engine)
 
 def safe_float(x, default=0.0):
     try:
@@ -218,11 +220,34 @@ def top_students():
 # -----------------------------
 @app.route("/course-stats", methods=["GET"])
 def course_stats():
-    students = Student.query.all()
-    stats = {}
-    for s in students:
-        stats.setdefault(s.course, []).append(s.total)
-    result = {course: round(sum(totals) / len(totals), 2) for course, totals in stats.items()}
+    rows = (
+        db.session.query(
+            Student.course,
+            db.func.count(Student.id),
+            db.func.avg(Student.total),
+            db.func.min(Student.total),
+            db.func.max(Student.total),
+            db.func.avg(Student.math),
+            db.func.avg(Student.science),
+            db.func.avg(Student.english),
+        )
+        .group_by(Student.course)
+        .all()
+    )
+    result = {
+        course: {
+            "count": count,
+            "mean": round(mean, 2),
+            "min": min_total,
+            "max": max_total,
+            "subjects": {
+                "math": round(math, 2),
+                "science": round(science, 2),
+                "english": round(english, 2),
+            },
+        }
+        for course, count, mean, min_total, max_total, math, science, english in rows
+    }
     return jsonify(result), 200
 
 
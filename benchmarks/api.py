@@ -0,0 +1,320 @@
+# benchmarks/api.py
+"""
+Throughput and latency percentiles of the API hot paths on seeded datasets.
+
+    python -m benchmarks.api [--students 1000 100000 1000000] [--photos no yes]
+                             [--transport asgi uvicorn] [--concurrency 1 16]
+                             [--requests 1000] [--endpoints students student ...]
+    python -m benchmarks.api --compare OLD.json NEW.json [--threshold 10]
+
+Datasets come from seed_data.seed (fixed seed) and are cached under
+benchmarks/.data; every run starts from a fresh copy, so photo uploads in one
+run don't leak into the next. Each (dataset, transport) pair runs in a child
+process because the app binds DATABASE_URL at import:
+
+  asgi     main.app in-process through httpx.ASGITransport (no network)
+  uvicorn  a uvicorn server on a free local port, driven over TCP
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json; --compare
+prints the change in requests/s and p95 between two such files.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+# ---------------------- Endpoints ----------------------
+# (method, url, httpx request kwargs) for one request against a dataset of n students
+
+@functools.lru_cache(maxsize=1)
+def _upload_photo() -> bytes:
+    import seed_data
+
+    return seed_data.generate_photos(1, seed=1)[0]
+
+
+def _photo_upload_body():
+    return {"file": ("photo.jpg", _upload_photo(), "image/jpeg")}
+
+
+ENDPOINTS = {
+    "students": lambda rng, n: ("GET", "/students", {"params": {"cursor": rng.randrange(n), "limit": 100}}),
+    "student": lambda rng, n: ("GET", f"/students/{rng.randint(1, n)}", {}),
+    "top-students": lambda rng, n: ("GET", "/top-students", {"params": {"limit": 10}}),
+    "course-stats": lambda rng, n: ("GET", "/course-stats", {}),
+    "predict-grade": lambda rng, n: ("POST", "/predict-grade", {"json": {
+        s: round(rng.uniform(20, 100), 1) for s in ("math", "science", "english", "attendance")
+    }}),
+    # writes last: every upload bumps the change counter the read endpoints' caches key on
+    "photo-upload": lambda rng, n: ("POST", f"/students/{rng.randint(1, n)}/photo", {"files": _photo_upload_body()}),
+}
+
+
+# ---------------------- Load generation ----------------------
+
+def summarize(latencies, errors: int, seconds: float) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+async def run_endpoint(client, name: str, students: int, requests: int, concurrency: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(f"{seed}:{name}")
+    plan = [ENDPOINTS[name](rng, students) for _ in range(warmup + requests)]
+    for method, url, kwargs in plan[:warmup]:
+        await client.request(method, url, **kwargs)
+
+    latencies, errors = [], 0
+    pending = iter(plan[warmup:])
+
+    async def worker():
+        nonlocal errors
+        # the workers share one iterator, so the plan is split between them
+        for method, url, kwargs in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_until_up(client, server, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+async def run_worker(config: dict) -> list:
+    """Child process side: run every (concurrency, endpoint) pair against one transport."""
+    import httpx
+
+    async def run_all(client):
+        results = []
+        for concurrency in config["concurrency"]:
+            for name in config["endpoints"]:
+                summary = await run_endpoint(
+                    client, name, config["students"], config["requests"], concurrency, config["warmup"], config["seed"],
+                )
+                results.append({"concurrency": concurrency, "endpoint": name, **summary})
+        return results
+
+    limits = httpx.Limits(max_connections=max(config["concurrency"]))
+    if config["transport"] == "asgi":
+        import main
+
+        # httpx's ASGI transport doesn't send lifespan events, run startup/shutdown here
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits) as client:
+                return await run_all(client)
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(config["workers"])],
+        cwd=ROOT,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await _wait_until_up(client, server)
+            return await run_all(client)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# ---------------------- Datasets ----------------------
+
+def dataset_path(students: int, photos: bool, seed: int) -> str:
+    return os.path.join(DATA_DIR, f"students-{students}{'-photos' if photos else ''}-seed{seed}.db")
+
+
+def prepare_dataset(students: int, photos: bool, seed: int, reseed: bool = False) -> str:
+    """Seed the dataset if it isn't cached yet and return a fresh working copy of it."""
+    path = dataset_path(students, photos, seed)
+    if reseed or not os.path.exists(path):
+        os.environ["PHOTO_STORE_DIR"] = os.path.join(DATA_DIR, "photos")
+        import seed_data
+        from database import create_db_engine
+
+        os.makedirs(DATA_DIR, exist_ok=True)
+        engine = create_db_engine(f"sqlite:///{path}")
+        started = time.perf_counter()
+        seed_data.seed(engine, students, photos, seed)
+        # closing the last connection checkpoints the WAL into the main file
+        engine.dispose()
+        print(f"seeded {os.path.basename(path)} in {time.perf_counter() - started:.1f}s")
+
+    working = os.path.join(DATA_DIR, "run.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(working + suffix):
+            os.remove(working + suffix)
+    shutil.copyfile(path, working)
+    return working
+
+
+def run_child(config: dict, database: str) -> list:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{database}",
+        "PHOTO_STORE_DIR": os.path.join(DATA_DIR, "photos"),
+    }
+    env.pop("ASYNC_DATABASE_URL", None)
+    env.pop("DATABASE_REPLICA_URLS", None)
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.api", "--worker", json.dumps(config)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, check=True, text=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ---------------------- Results ----------------------
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment() -> dict:
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _key(result: dict) -> tuple:
+    return (result["students"], result["photos"], result["transport"], result["concurrency"], result["endpoint"])
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print rps / p95 changes between two result files; exit status 1 if anything regressed past threshold %."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {_key(r): r for r in old["results"]}
+    print(f"{old['env']['commit']} -> {new['env']['commit']}, regression threshold {threshold:.0f}%")
+    print(f"{'students':>9} {'photos':>6} {'transport':>9} {'conc':>4} {'endpoint':>14}"
+          f" {'rps':>20} {'change':>7} {'p95 ms':>20} {'change':>7}")
+    regressed = 0
+    for r in new["results"]:
+        o = before.get(_key(r))
+        if o is None:
+            continue
+        rps_change = (r["rps"] / o["rps"] - 1) * 100 if o["rps"] else 0.0
+        p95_change = (r["p95_ms"] / o["p95_ms"] - 1) * 100 if o["p95_ms"] else 0.0
+        flag = " <-" if rps_change < -threshold or p95_change > threshold else ""
+        regressed += bool(flag)
+        print(
+            f"{r['students']:>9} {str(r['photos']):>6} {r['transport']:>9} {r['concurrency']:>4} {r['endpoint']:>14}"
+            f" {o['rps']:>8.1f} -> {r['rps']:>8.1f} {rps_change:>+6.1f}%"
+            f" {o['p95_ms']:>8.2f} -> {r['p95_ms']:>8.2f} {p95_change:>+6.1f}%{flag}"
+        )
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--photos", choices=["no", "yes"], nargs="+", default=["no"])
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], nargs="+", default=["asgi"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per endpoint and concurrency")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--endpoints", choices=list(ENDPOINTS), nargs="+", default=list(ENDPOINTS))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reseed", action="store_true", help="regenerate cached datasets")
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% change reported as a regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(json.loads(args.worker)))))
+        return
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    env = environment()
+    print(f"commit {env['commit']}{' (dirty)' if env['dirty'] else ''}, python {env['python']}, {env['cpus']} cpus")
+    print(f"{'students':>9} {'photos':>6} {'transport':>9} {'conc':>4} {'endpoint':>14}"
+          f" {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    results = []
+    for students in args.students:
+        for photos in [p == "yes" for p in args.photos]:
+            for transport in args.transport:
+                database = prepare_dataset(students, photos, args.seed, args.reseed)
+                config = {
+                    "students": students, "transport": transport, "concurrency": args.concurrency,
+                    "requests": args.requests, "warmup": args.warmup, "endpoints": args.endpoints,
+                    "workers": args.workers, "seed": args.seed,
+                }
+                for r in run_child(config, database):
+                    r = {"students": students, "photos": photos, "transport": transport, **r}
+                    results.append(r)
+                    print(
+                        f"{students:>9} {str(photos):>6} {transport:>9} {r['concurrency']:>4} {r['endpoint']:>14}"
+                        f" {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>6}"
+                    )
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    path = os.path.join(args.out, f"{stamp}-{env['commit'] or 'nogit'}.json")
+    with open(path, "w") as f:
+        json.dump({"env": env, "args": vars(args), "results": results}, f, indent=2)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
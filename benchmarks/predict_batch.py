@@ -0,0 +1,71 @@
+# benchmarks/predict_batch.py
+"""
+Per-student cost of POST /predict-grade in a loop vs one POST /predict-grade/batch.
+
+    python -m benchmarks.predict_batch [--students 1000 10000] [--repeat 3]
+
+Both go through the ASGI app in-process (TestClient), so the numbers include
+request parsing and response encoding but no network.
+"""
+import argparse
+import random
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def make_records(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "math": round(rnd.uniform(20, 100), 1),
+            "science": round(rnd.uniform(20, 100), 1),
+            "english": round(rnd.uniform(20, 100), 1),
+            "attendance": round(rnd.uniform(50, 100), 1),
+        }
+        for i in range(n)
+    ]
+
+
+def loop_single(client, records):
+    for record in records:
+        client.post("/predict-grade", json=record).raise_for_status()
+
+
+def batch(client, records):
+    client.post("/predict-grade/batch", json=records).raise_for_status()
+
+
+def best_of(fn, client, records, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(client, records)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    client = TestClient(main.app)
+    print(f"{'students':>9} {'path':>7} {'total ms':>10} {'us/student':>11} {'speedup':>8}")
+    for n in args.students:
+        records = make_records(n)
+        timings = {"single": best_of(loop_single, client, records, args.repeat),
+                   "batch": best_of(batch, client, records, args.repeat)}
+        for name, seconds in timings.items():
+            print(
+                f"{n:>9} {name:>7} {seconds * 1000:>10.1f} {seconds / n * 1e6:>11.1f}"
+                f" {timings['single'] / seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,99 @@
+# benchmarks/serialization.py
+"""
+Per-row cost of encoding a /students page, old path vs direct encoding.
+
+    python -m benchmarks.serialization [--rows 10000 100000] [--repeat 3]
+
+"pydantic" is what the handlers used to do: StudentOut.model_validate(row)
+.model_dump() per row, then FastAPI validating the list against
+response_model and running jsonable_encoder before json.dumps.
+"direct" is serialization.rows_to_json on the row tuples.
+"""
+import argparse
+import json
+import random
+import time
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import models
+import schemas
+import serialization
+
+COLUMNS = [f for f in serialization.STUDENT_FIELDS if f != "photo_url"]
+COURSES = ["Physics", "Chemistry", "Maths", "Biology", "History"]
+
+
+def make_rows(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        marks = {s: round(rnd.uniform(30, 100), 1) for s in ("math", "science", "english")}
+        models.compute_totals_and_grades([marks])
+        row = {
+            "id": i,
+            "name": f"Student {i}",
+            "course": rnd.choice(COURSES),
+            "attendance": round(rnd.uniform(60, 100), 1),
+            "photo_hash": None,
+            **marks,
+        }
+        rows.append(tuple(row[c] for c in COLUMNS))
+    return rows
+
+
+def pydantic_path(rows) -> bytes:
+    response_adapter = TypeAdapter(List[schemas.StudentOut])
+    out = []
+    for row in rows:
+        obj = SimpleNamespace(**dict(zip(COLUMNS, row)))
+        obj.photo_url = models.photo_url(obj.id, obj.photo_hash)
+        out.append(schemas.StudentOut.model_validate(obj, from_attributes=True).model_dump())
+    validated = response_adapter.validate_python(out)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def direct_path(rows) -> bytes:
+    out = serialization.rows_to_dicts(COLUMNS, rows)
+    for obj in out:
+        obj["photo_url"] = models.photo_url(obj["id"], obj["photo_hash"])
+    return serialization.dumps(out)
+
+
+PATHS = {"pydantic": pydantic_path, "direct": direct_path}
+
+
+def bench(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"encoder: {encoder}, best of {args.repeat}")
+    print(f"{'rows':>8} {'path':>9} {'total ms':>10} {'us/row':>8} {'speedup':>8}")
+    for n in args.rows:
+        rows = make_rows(n)
+        assert json.loads(pydantic_path(rows[:100])) == json.loads(direct_path(rows[:100]))
+        timings = {name: bench(fn, rows, args.repeat) for name, fn in PATHS.items()}
+        for name, seconds in timings.items():
+            print(
+                f"{n:>8} {name:>9} {seconds * 1000:>10.1f} {seconds / n * 1e6:>8.2f}"
+                f" {timings['pydantic'] / seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# cache.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+# Also bounds how stale another worker's local copy can get after a write
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+# "" = in-process only, "redis://..." or "sqlite:///path/to/cache.db" for a shared tier
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "")
+
+
+# ---------------------- Tags ----------------------
+# Cached responses are tagged with what they were built from
+
+COURSE_STATS_TAG = "course-stats"
+
+
+def student_tag(student_id: int) -> str:
+    return f"student:{student_id}"
+
+
+def top_tag(course: Optional[str] = None) -> str:
+    """Tag of the overall leaderboard, or of one course's leaderboard."""
+    return f"top:{course}" if course is not None else "top"
+
+
+class CacheBackend:
+    """
+    Byte cache keyed by string. Entries carry tags so writes can invalidate
+    every entry derived from a student or course in one call.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        raise NotImplementedError
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires, value, tags)
+        self._tags: Dict[str, Set[str]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisCache(CacheBackend):
+    """
+    Shared tier on Redis; tags are kept as Redis sets of keys. A tag set
+    expires with the longest-lived entry added to it.
+    """
+
+    # SADD, then push the set's expiry out to the entry's if that is later
+    _TAG_SCRIPT = """
+    for _, tag in ipairs(KEYS) do
+        redis.call('SADD', tag, ARGV[1])
+        if redis.call('PTTL', tag) < tonumber(ARGV[2]) then
+            redis.call('PEXPIRE', tag, ARGV[2])
+        end
+    end
+    """
+
+    def __init__(self, url: str, prefix: str = "students-api:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._tag = self._redis.register_script(self._TAG_SCRIPT)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._redis.get(self._prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        ms = int(ttl * 1000)
+        tag_keys = [self._prefix + "tag:" + tag for tag in tags]
+        pipe = self._redis.pipeline()
+        pipe.set(self._prefix + key, value, px=ms)
+        if tag_keys:
+            self._tag(keys=tag_keys, args=[self._prefix + key, ms], client=pipe)
+        pipe.execute()
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            tag_key = self._prefix + "tag:" + tag
+            keys = self._redis.smembers(tag_key)
+            if keys:
+                self._redis.delete(*keys)
+            self._redis.delete(tag_key)
+
+    def clear(self) -> None:
+        keys = list(self._redis.scan_iter(self._prefix + "*"))
+        if keys:
+            self._redis.delete(*keys)
+
+
+class SqliteCache(CacheBackend):
+    """
+    Local stand-in for the shared tier: a SQLite file that every worker on
+    the machine can open. Same semantics as RedisCache, no server needed.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT, key TEXT, PRIMARY KEY (tag, key))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+            conn.executemany("INSERT OR IGNORE INTO cache_tags VALUES (?, ?)", [(tag, key) for tag in tags])
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        conn = self._conn()
+        tags = list(tags)
+        marks = ",".join("?" * len(tags))
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(f"DELETE FROM cache WHERE key IN (SELECT key FROM cache_tags WHERE tag IN ({marks}))", tags)
+            conn.execute(f"DELETE FROM cache_tags WHERE tag IN ({marks})", tags)
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM cache")
+            conn.execute("DELETE FROM cache_tags")
+
+
+def make_backend(url: str) -> Optional[CacheBackend]:
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCache(url)
+    if url.startswith("sqlite:///"):
+        return SqliteCache(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported RESPONSE_CACHE_BACKEND: {url}")
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized JSON responses: a local LRU in front of
+    an optional shared backend, with hit/miss counters. The shared backend
+    does network or disk I/O: async handlers use aget/aset, and invalidate()
+    moves it off the event loop when called from one.
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[CacheBackend] = None, ttl: float = RESPONSE_CACHE_TTL):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._pending: Set[asyncio.Future] = set()
+
+    def _get_local(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def _got_shared(self, key: str, value: Optional[bytes], tags: Iterable[str]) -> Optional[bytes]:
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.shared_hits += 1
+        self.local.set(key, value, self.ttl, tags)
+        return value
+
+    def get(self, key: str, tags: Iterable[str] = ()) -> Optional[bytes]:
+        """`tags` are attached to the local copy when the value comes from the shared tier."""
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        return self._got_shared(key, self.shared.get(key) if self.shared is not None else None, tags)
+
+    async def aget(self, key: str, tags: Iterable[str] = ()) -> Optional[bytes]:
+        """get() for async handlers, the shared tier is read in the threadpool."""
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        shared = await run_in_threadpool(self.shared.get, key) if self.shared is not None else None
+        return self._got_shared(key, shared, tags)
+
+    def set(self, key: str, value: bytes, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        self.local.set(key, value, self.ttl, tags)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl, tags)
+
+    async def aset(self, key: str, value: bytes, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        self.local.set(key, value, self.ttl, tags)
+        if self.shared is not None:
+            await run_in_threadpool(self.shared.set, key, value, self.ttl, tags)
+
+    def invalidate(self, *tags: str) -> None:
+        self.local.invalidate_tags(tags)
+        if self.shared is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.shared.invalidate_tags(tags)
+            return
+        # a crud write run through AsyncSession.run_sync is on the event loop.
+        # Not waiting is safe for reads: cache keys carry the row or table
+        # version, so an entry this would drop can no longer be looked up.
+        future = loop.run_in_executor(None, self.shared.invalidate_tags, tags)
+        self._pending.add(future)
+        future.add_done_callback(self._invalidated)
+
+    def _invalidated(self, future: asyncio.Future) -> None:
+        self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Shared cache invalidation failed", exc_info=future.exception())
+
+    def clear(self) -> None:
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.local),
+            "shared_backend": type(self.shared).__name__ if self.shared else None,
+        }
+
+
+response_cache = ResponseCache(LRUCache(), make_backend(RESPONSE_CACHE_BACKEND))
@@ -1,20 +1,227 @@
 # crud.py
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from cache import COURSE_STATS_TAG, response_cache, student_tag, top_tag
+from database import replica_reads
+import os
+import leaderboard
 import models, schemas
-from typing import List, Optional
+import photo_store
+from typing import List, Optional, Tuple
+
+# Maintain the course_stats table on every write so /course-stats reads
+# O(#courses) rows instead of aggregating the students table
+MATERIALIZED_COURSE_STATS = os.getenv("MATERIALIZED_COURSE_STATS", "0") == "1"
+
+SUBJECTS = ("math", "science", "english")
+
+# How long student_changes entries are kept; older cursors must resync
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+
+
+# --------------------------------------
+# CHANGE COUNTER
+# --------------------------------------
+STUDENTS_TABLE = models.Student.__tablename__
+
+
+def bump_table_version(db: Session, name: str = STUDENTS_TABLE) -> None:
+    """Increment the change counter of `name` as part of the caller's transaction."""
+    TV = models.TableVersion
+    result = db.execute(update(TV).where(TV.name == name).values(version=TV.version + 1))
+    if result.rowcount == 0:
+        db.add(TV(name=name, version=1))
+
+
+def table_version_stmt(name: str = STUDENTS_TABLE):
+    return select(models.TableVersion.version).where(models.TableVersion.name == name)
+
+
+def table_version(db: Session, name: str = STUDENTS_TABLE) -> int:
+    with replica_reads(db):
+        return db.execute(table_version_stmt(name)).scalar() or 0
+
+
+def student_version_stmt(student_id: int):
+    return select(models.Student.version).where(models.Student.id == student_id)
+
+
+# --------------------------------------
+# CHANGE LOG
+# --------------------------------------
+def _log_changes(db: Session, op: str, student_ids: List[int]) -> None:
+    if student_ids:
+        db.execute(
+            models.StudentChange.__table__.insert(),
+            [{"student_id": student_id, "op": op} for student_id in student_ids],
+        )
+
+
+def _record_write(db: Session, op: str, student_ids: List[int]) -> int:
+    """
+    Bookkeeping shared by every student write, run inside its transaction.
+    Returns the table version the write commits as.
+    """
+    bump_table_version(db)
+    _log_changes(db, op, student_ids)
+    return db.execute(table_version_stmt()).scalar()
+
+
+def change_cursor(db: Session) -> int:
+    """Id of the newest change log entry, 0 if nothing was logged yet."""
+    with replica_reads(db):
+        return db.execute(select(func.max(models.StudentChange.id))).scalar() or 0
+
+
+def student_changes(db: Session, since: int, limit: int = 1000):
+    """
+    Students changed after cursor `since`, one entry per student, as
+    (change_id, op, student_id, Student or None) ordered by change_id.
+    Returns None when `since` predates the retained log.
+    """
+    C = models.StudentChange
+    with replica_reads(db):
+        oldest = db.execute(select(func.min(C.id))).scalar()
+        if oldest is not None and since < oldest - 1:
+            return None
+
+        latest = (
+            select(C.student_id, func.max(C.id).label("change_id"))
+            .where(C.id > since)
+            .group_by(C.student_id)
+            .subquery()
+        )
+        rows = db.execute(
+            select(latest.c.change_id, C.op, latest.c.student_id)
+            .join(C, C.id == latest.c.change_id)
+            .order_by(latest.c.change_id)
+            .limit(limit)
+        ).all()
+
+        students = {}
+        for chunk in _id_chunks([student_id for _, _, student_id in rows]):
+            students.update(
+                (s.id, s) for s in db.query(models.Student).filter(models.Student.id.in_(chunk))
+            )
+
+    return [
+        (change_id, op if student_id in students else "delete", student_id, students.get(student_id))
+        for change_id, op, student_id in rows
+    ]
+
+
+def prune_student_changes(db: Session, older_than: Optional[datetime] = None) -> int:
+    """Drop change log entries older than `older_than`, always keeping the newest."""
+    if older_than is None:
+        older_than = datetime.utcnow() - timedelta(days=CHANGE_LOG_RETENTION_DAYS)
+    C = models.StudentChange
+    newest = select(func.max(C.id)).scalar_subquery()
+    result = db.execute(
+        delete(C).where(C.changed_at < older_than, C.id < newest).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _invalidate_cache(student_ids=(), courses=()) -> None:
+    """Drop cached responses a committed score/course change can affect."""
+    tags = [top_tag(), COURSE_STATS_TAG]
+    tags += [top_tag(course) for course in courses]
+    tags += [student_tag(student_id) for student_id in student_ids]
+    response_cache.invalidate(*tags)
 
 
 # --------------------------------------
 # GET ALL STUDENTS
 # --------------------------------------
-def get_students(db: Session) -> List[models.Student]:
-    return db.query(models.Student).all()
+def students_stmt(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+):
+    """SELECT behind get_students, shared with crud_async."""
+    S = models.Student
+    stmt = select(*[getattr(S, f) for f in fields]) if fields else select(S)
+
+    if course is not None:
+        stmt = stmt.where(S.course == course)
+    if grade is not None:
+        stmt = stmt.where(S.grade == grade)
+    if min_total is not None:
+        stmt = stmt.where(S.total >= min_total)
+    if max_total is not None:
+        stmt = stmt.where(S.total <= max_total)
+    if after_id is not None:
+        stmt = stmt.where(S.id > after_id)
+
+    stmt = stmt.order_by(S.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def get_students(
+    db: Session,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+):
+    """
+    Keyset-paginated student listing ordered by id.
+    When `fields` is given only those columns are selected and plain rows
+    are returned instead of Student objects.
+    """
+    with replica_reads(db):
+        result = db.execute(students_stmt(after_id, limit, fields, course, grade, min_total, max_total))
+        return result.all() if fields else result.scalars().all()
+
+
+# --------------------------------------
+# STREAM STUDENTS (EXPORT)
+# --------------------------------------
+def iter_students(
+    db: Session,
+    fields: List[str],
+    batch_size: int = 1000,
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+):
+    """
+    Yield lists of up to `batch_size` row tuples, reading the cursor with
+    yield_per so memory stays constant however many students there are.
+    """
+    S = models.Student
+    stmt = select(*[getattr(S, f) for f in fields]).order_by(S.id)
+    if course is not None:
+        stmt = stmt.where(S.course == course)
+    if grade is not None:
+        stmt = stmt.where(S.grade == grade)
+
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield rows
 
 
 # --------------------------------------
 # GET SINGLE STUDENT
 # --------------------------------------
 def get_student(db: Session, student_id: int) -> Optional[models.Student]:
+    with replica_reads(db):
+        return _load_student(db, student_id)
+
+
+def _load_student(db: Session, student_id: int) -> Optional[models.Student]:
+    # write paths load through here so they always read the primary
     return db.query(models.Student).filter(models.Student.id == student_id).first()
 
 
@@ -33,11 +240,80 @@ def create_student(db: Session, student_in: schemas.StudentCreate) -> models.Stu
     s.compute_total_and_grade()
 
     db.add(s)
+    _course_stats_add(db, _score_snapshot(s))
+    db.flush()
+    version = _record_write(db, "insert", [s.id])
     db.commit()
     db.refresh(s)
+    leaderboard.board.add(s.id, s.course, s.total, version)
+    _invalidate_cache(courses=[s.course])
     return s
 
 
+# --------------------------------------
+# BULK CREATE STUDENTS
+# --------------------------------------
+def bulk_create_students(db: Session, items: List[Tuple[int, schemas.StudentImport]]):
+    """
+    Insert one chunk of (row_number, StudentImport) pairs with a single
+    executemany in one transaction. Returns (inserted, errors) where errors
+    is a list of {"row", "error"} for duplicates and failed inserts.
+    """
+    errors = []
+    rows = []
+    numbers = []
+    seen_emails = set()
+
+    emails = [item.email for _, item in items if item.email]
+    existing = set()
+    if emails:
+        existing = {
+            e for (e,) in db.query(models.Student.email).filter(models.Student.email.in_(emails))
+        }
+
+    for number, item in items:
+        if item.email:
+            if item.email in existing or item.email in seen_emails:
+                errors.append({"row": number, "error": f"Duplicate email: {item.email}"})
+                continue
+            seen_emails.add(item.email)
+        rows.append(item.model_dump())
+        numbers.append(number)
+
+    if not rows:
+        return 0, errors
+
+    models.compute_totals_and_grades(rows)
+    table = models.Student.__table__
+    try:
+        ids = db.execute(table.insert().returning(table.c.id), rows).scalars().all()
+        _record_write(db, "insert", ids)
+        db.commit()
+        inserted = len(rows)
+    except SQLAlchemyError:
+        # fall back to row by row so only the offending rows are reported
+        db.rollback()
+        inserted = 0
+        for number, row in zip(numbers, rows):
+            try:
+                result = db.execute(table.insert(), row)
+                _record_write(db, "insert", list(result.inserted_primary_key))
+                db.commit()
+                inserted += 1
+            except SQLAlchemyError as e:
+                db.rollback()
+                errors.append({"row": number, "error": str(getattr(e, "orig", e))})
+
+    if inserted:
+        if MATERIALIZED_COURSE_STATS:
+            rebuild_course_stats(db, sorted({row["course"] for row in rows}))
+        leaderboard.board.reset()
+        _invalidate_cache(courses={row["course"] for row in rows})
+
+    errors.sort(key=lambda e: e["row"])
+    return inserted, errors
+
+
 # --------------------------------------
 # UPDATE STUDENT (PARTIAL UPDATE)
 # --------------------------------------
@@ -47,7 +323,7 @@ def update_student(
     student_in: schemas.StudentUpdate
 ) -> Optional[models.Student]:
 
-    s = get_student(db, student_id)
+    s = _load_student(db, student_id)
     if not s:
         return None
 
@@ -57,6 +333,8 @@ def update_student(
     update_data.pop("total", None)
     update_data.pop("grade", None)
 
+    old_scores = _score_snapshot(s)
+
     # Apply only provided fields
     for key, value in update_data.items():
         setattr(s, key, value)
@@ -64,59 +342,327 @@ def update_student(
     # Recalculate totals
     s.compute_total_and_grade()
 
+    new_scores = _score_snapshot(s)
+    if new_scores != old_scores:
+        _course_stats_remove(db, old_scores)
+        _course_stats_add(db, new_scores)
+
+    s.version = (s.version or 0) + 1
+    version = _record_write(db, "update", [student_id])
     db.commit()
     db.refresh(s)
+    leaderboard.board.update(s.id, s.course, s.total, version)
+    _invalidate_cache([student_id], {old_scores[0], s.course})
     return s
 
 
+# --------------------------------------
+# BULK UPDATE / DELETE
+# --------------------------------------
+# Keep IN (...) lists under SQLite's bound parameter limit
+BULK_ID_CHUNK = 900
+
+
+def _grade_expr(avg):
+    """SQL CASE equivalent of Student.compute_total_and_grade's grade ladder."""
+    whens = [
+        (avg >= cutoff, grade)
+        for cutoff, grade in reversed(list(zip(models.GRADE_CUTOFFS, models.GRADES[1:])))
+    ]
+    return case(*whens, else_=models.GRADES[0])
+
+
+def _id_chunks(ids: List[int]):
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), BULK_ID_CHUNK):
+        yield ids[i:i + BULK_ID_CHUNK]
+
+
+def _courses_of(db: Session, ids: List[int]) -> set:
+    courses = set()
+    for chunk in _id_chunks(ids):
+        courses.update(c for (c,) in db.query(models.Student.course).filter(models.Student.id.in_(chunk)).distinct())
+    return courses
+
+
+def _after_bulk_write(db: Session, op: str, ids: List[int], courses: set) -> None:
+    _record_write(db, op, ids)
+    if MATERIALIZED_COURSE_STATS and courses:
+        rebuild_course_stats(db, sorted(courses))  # commits
+    else:
+        db.commit()
+    leaderboard.board.reset()
+    _invalidate_cache(ids, courses)
+
+
+def bulk_update_students(db: Session, updates: List[schemas.StudentBulkUpdate]) -> int:
+    """
+    Apply each {ids, changes} group with set-based UPDATEs that recompute
+    total and grade in SQL. Everything runs in one transaction; returns the
+    number of rows updated.
+    """
+    S = models.Student
+    updated_ids = []
+    courses = set()
+
+    for u in updates:
+        data = u.changes.model_dump(exclude_unset=True)
+        data.pop("total", None)
+        data.pop("grade", None)
+        if not data or not u.ids:
+            continue
+
+        values = dict(data)
+        if any(subject in data for subject in SUBJECTS):
+            # SET evaluates against the old row, so provided marks go in as literals
+            total = sum(
+                literal(data[subject] or 0) if subject in data else func.coalesce(getattr(S, subject), 0)
+                for subject in SUBJECTS
+            )
+            values["total"] = total
+            values["grade"] = _grade_expr(total / 3.0)
+        values["version"] = func.coalesce(S.version, 0) + 1
+
+        courses |= _courses_of(db, u.ids)
+        if "course" in data:
+            courses.add(data["course"])
+
+        for chunk in _id_chunks(u.ids):
+            result = db.execute(
+                update(S)
+                .where(S.id.in_(chunk))
+                .values(**values)
+                .returning(S.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated_ids += result.scalars().all()
+
+    _after_bulk_write(db, "update", updated_ids, courses)
+    return len(updated_ids)
+
+
+def bulk_delete_students(db: Session, ids: List[int]) -> int:
+    """Delete all students in ids in one transaction, returns rows deleted."""
+    S = models.Student
+    courses = _courses_of(db, ids)
+    deleted_ids = []
+    for chunk in _id_chunks(ids):
+        result = db.execute(
+            delete(S).where(S.id.in_(chunk)).returning(S.id).execution_options(synchronize_session=False)
+        )
+        deleted_ids += result.scalars().all()
+
+    _after_bulk_write(db, "delete", deleted_ids, courses)
+    return len(deleted_ids)
+
+
 # --------------------------------------
 # DELETE STUDENT
 # --------------------------------------
 def delete_student(db: Session, student_id: int) -> bool:
-    s = get_student(db, student_id)
+    s = _load_student(db, student_id)
     if not s:
         return False
+    scores = _score_snapshot(s)
     db.delete(s)
+    _course_stats_remove(db, scores)
+    version = _record_write(db, "delete", [student_id])
     db.commit()
+    leaderboard.board.remove(student_id, version)
+    _invalidate_cache([student_id], [scores[0]])
     return True
 
 
 # --------------------------------------
-# SET STUDENT PHOTO (BLOB)
+# SET STUDENT PHOTO
 # --------------------------------------
 def set_student_photo(db: Session, student_id: int, photo_bytes: bytes) -> Optional[models.Student]:
-    s = get_student(db, student_id)
+    if not get_student_photo_meta(db, student_id):
+        return None
+    return set_student_photo_hash(db, student_id, photo_store.store.put(photo_bytes))
+
+
+def set_student_photo_hash(db: Session, student_id: int, photo_hash: str) -> Optional[models.Student]:
+    """Point a student at a photo already written to the photo store."""
+    s = _load_student(db, student_id)
     if not s:
         return None
-    s.photo = photo_bytes
+    # Bytes live in the photo store, the row only keeps the content hash
+    s.photo_hash = photo_hash
+    s.photo = None
+    s.photo_updated_at = datetime.utcnow()
+    s.version = (s.version or 0) + 1
+    version = _record_write(db, "update", [student_id])
     db.commit()
     db.refresh(s)
+    # totals are unchanged, this only keeps the leaderboard at the new table version
+    leaderboard.board.update(s.id, s.course, s.total, version)
+    # photo_url only appears in the student's own response
+    response_cache.invalidate(student_tag(student_id))
     return s
 
 
 # --------------------------------------
-# TOP STUDENTS
+# GET STUDENT PHOTO
 # --------------------------------------
-def top_students(db: Session, limit: int = 5):
+def get_student_photo_meta(db: Session, student_id: int):
+    """(photo_hash, photo_updated_at) without loading the image itself."""
     return (
-        db.query(models.Student)
-        .order_by(models.Student.total.desc())
-        .limit(limit)
-        .all()
+        db.query(models.Student.photo_hash, models.Student.photo_updated_at)
+        .filter(models.Student.id == student_id)
+        .first()
     )
 
 
+def get_student_photo(db: Session, student_id: int) -> Optional[bytes]:
+    """Legacy photo BLOB for rows uploaded before the photo store existed."""
+    return db.query(models.Student.photo).filter(models.Student.id == student_id).scalar()
+
+
 # --------------------------------------
-# COURSE STATS
+# TOP STUDENTS
 # --------------------------------------
-def course_stats(db: Session):
-    students = get_students(db)
-    stats = {}
+def top_students_stmt(limit: int = 5, course: Optional[str] = None):
+    stmt = select(models.Student)
+    if course is not None:
+        # served by ix_student_course_total
+        stmt = stmt.where(models.Student.course == course)
+    return stmt.order_by(models.Student.total.desc()).limit(limit)
+
+
+def top_students(db: Session, limit: int = 5, course: Optional[str] = None):
+    with replica_reads(db):
+        return db.execute(top_students_stmt(limit, course)).scalars().all()
+
+
+# --------------------------------------
+# STUDENT RANK
+# --------------------------------------
+def student_rank(db: Session, student_id: int):
+    """Rank and percentile overall and within the course, None if unknown."""
+    with replica_reads(db):
+        leaderboard.board.ensure_loaded(db, table_version(db))
+    return leaderboard.board.rank(student_id)
 
-    for st in students:
-        stats.setdefault(st.course, []).append(st.total)
 
+# --------------------------------------
+# COURSE STATS
+# --------------------------------------
+def course_stats_entry(count, sum_total, min_total, max_total, sum_math, sum_science, sum_english):
     return {
-        course: round(sum(vals) / len(vals), 2)
-        for course, vals in stats.items()
+        "count": count,
+        "mean": round(sum_total / count, 2),
+        "min": min_total,
+        "max": max_total,
+        "subjects": {
+            "math": round(sum_math / count, 2),
+            "science": round(sum_science / count, 2),
+            "english": round(sum_english / count, 2),
+        },
     }
+
+
+def course_stats_stmt():
+    """(course, count, sum_total, min_total, max_total, sum_math, sum_science, sum_english) rows."""
+    if MATERIALIZED_COURSE_STATS:
+        CS = models.CourseStat
+        return select(
+            CS.course, CS.count, CS.sum_total, CS.min_total, CS.max_total,
+            CS.sum_math, CS.sum_science, CS.sum_english,
+        ).where(CS.count > 0)
+
+    S = models.Student
+    return select(
+        S.course,
+        func.count(S.id),
+        func.sum(S.total),
+        func.min(S.total),
+        func.max(S.total),
+        func.sum(S.math),
+        func.sum(S.science),
+        func.sum(S.english),
+    ).group_by(S.course)
+
+
+def course_stats(db: Session):
+    """Per-course count, mean/min/max total and per-subject averages."""
+    with replica_reads(db):
+        return {row[0]: course_stats_entry(*row[1:]) for row in db.execute(course_stats_stmt())}
+
+
+def rebuild_course_stats(db: Session, courses: Optional[List[str]] = None) -> None:
+    """Recompute the course_stats rows (all, or only `courses`) with one GROUP BY."""
+    S = models.Student
+    stale = db.query(models.CourseStat)
+    q = db.query(
+        S.course,
+        func.count(S.id),
+        func.coalesce(func.sum(S.total), 0),
+        func.min(S.total),
+        func.max(S.total),
+        func.coalesce(func.sum(S.math), 0),
+        func.coalesce(func.sum(S.science), 0),
+        func.coalesce(func.sum(S.english), 0),
+    )
+    if courses is not None:
+        stale = stale.filter(models.CourseStat.course.in_(courses))
+        q = q.filter(S.course.in_(courses))
+
+    stale.delete(synchronize_session=False)
+    db.add_all([
+        models.CourseStat(
+            course=course, count=count, sum_total=sum_total, min_total=min_total, max_total=max_total,
+            sum_math=sum_math, sum_science=sum_science, sum_english=sum_english,
+        )
+        for course, count, sum_total, min_total, max_total, sum_math, sum_science, sum_english
+        in q.group_by(S.course).all()
+    ])
+    db.commit()
+
+
+def _score_snapshot(s: models.Student):
+    return (s.course, s.total or 0, s.math or 0, s.science or 0, s.english or 0)
+
+
+def _course_stats_add(db: Session, scores) -> None:
+    if not MATERIALIZED_COURSE_STATS:
+        return
+    course, total, math, science, english = scores
+    cs = db.get(models.CourseStat, course)
+    if cs is None:
+        cs = models.CourseStat(course=course, count=0, sum_total=0.0,
+                               sum_math=0.0, sum_science=0.0, sum_english=0.0)
+        db.add(cs)
+    cs.count += 1
+    cs.sum_total += total
+    cs.sum_math += math
+    cs.sum_science += science
+    cs.sum_english += english
+    cs.min_total = total if cs.min_total is None else min(cs.min_total, total)
+    cs.max_total = total if cs.max_total is None else max(cs.max_total, total)
+
+
+def _course_stats_remove(db: Session, scores) -> None:
+    if not MATERIALIZED_COURSE_STATS:
+        return
+    course, total, math, science, english = scores
+    cs = db.get(models.CourseStat, course)
+    if cs is None:
+        return
+    cs.count -= 1
+    if cs.count <= 0:
+        db.delete(cs)
+        return
+    cs.sum_total -= total
+    cs.sum_math -= math
+    cs.sum_science -= science
+    cs.sum_english -= english
+    # min/max can't be undone incrementally, re-read them only when the
+    # removed student was on the boundary
+    if total <= cs.min_total or total >= cs.max_total:
+        db.flush()
+        cs.min_total, cs.max_total = (
+            db.query(func.min(models.Student.total), func.max(models.Student.total))
+            .filter(models.Student.course == course)
+            .one()
+        )
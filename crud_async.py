@@ -0,0 +1,106 @@
+# crud_async.py
+# AsyncSession versions of the crud functions, for use with database.get_async_db.
+# Reads build on the same statements as crud; writes run the sync crud
+# function through AsyncSession.run_sync so course stats and the leaderboard
+# are maintained in exactly one place.
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import replica_reads
+import crud, models, schemas
+from typing import List, Optional
+
+
+# --------------------------------------
+# CHANGE COUNTERS
+# --------------------------------------
+async def table_version(db: AsyncSession, name: str = crud.STUDENTS_TABLE) -> int:
+    with replica_reads(db):
+        return (await db.execute(crud.table_version_stmt(name))).scalar() or 0
+
+
+async def student_version(db: AsyncSession, student_id: int) -> Optional[int]:
+    """Row version of a student, None if it doesn't exist."""
+    with replica_reads(db):
+        return (await db.execute(crud.student_version_stmt(student_id))).scalar()
+
+
+# --------------------------------------
+# CHANGE FEED
+# --------------------------------------
+async def change_cursor(db: AsyncSession) -> int:
+    return await db.run_sync(crud.change_cursor)
+
+
+async def student_changes(db: AsyncSession, since: int, limit: int = 1000):
+    return await db.run_sync(crud.student_changes, since, limit)
+
+
+# --------------------------------------
+# GET ALL STUDENTS
+# --------------------------------------
+async def get_students(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+):
+    with replica_reads(db):
+        result = await db.execute(crud.students_stmt(after_id, limit, fields, course, grade, min_total, max_total))
+        return result.all() if fields else result.scalars().all()
+
+
+# --------------------------------------
+# GET SINGLE STUDENT
+# --------------------------------------
+async def get_student(db: AsyncSession, student_id: int) -> Optional[models.Student]:
+    with replica_reads(db):
+        result = await db.execute(select(models.Student).where(models.Student.id == student_id))
+        return result.scalars().first()
+
+
+# --------------------------------------
+# CREATE / UPDATE / DELETE STUDENT
+# --------------------------------------
+async def create_student(db: AsyncSession, student_in: schemas.StudentCreate) -> models.Student:
+    return await db.run_sync(crud.create_student, student_in)
+
+
+async def update_student(
+    db: AsyncSession,
+    student_id: int,
+    student_in: schemas.StudentUpdate
+) -> Optional[models.Student]:
+    return await db.run_sync(crud.update_student, student_id, student_in)
+
+
+async def delete_student(db: AsyncSession, student_id: int) -> bool:
+    return await db.run_sync(crud.delete_student, student_id)
+
+
+# --------------------------------------
+# TOP STUDENTS
+# --------------------------------------
+async def top_students(db: AsyncSession, limit: int = 5, course: Optional[str] = None):
+    with replica_reads(db):
+        result = await db.execute(crud.top_students_stmt(limit, course))
+        return result.scalars().all()
+
+
+# --------------------------------------
+# STUDENT RANK
+# --------------------------------------
+async def student_rank(db: AsyncSession, student_id: int):
+    return await db.run_sync(crud.student_rank, student_id)
+
+
+# --------------------------------------
+# COURSE STATS
+# --------------------------------------
+async def course_stats(db: AsyncSession):
+    with replica_reads(db):
+        result = await db.execute(crud.course_stats_stmt())
+        return {row[0]: crud.course_stats_entry(*row[1:]) for row in result}
@@ -12,7 +12,7 @@ st.title("🎓 Smart Student Management Dashboard")
 # --- Wait for API ---
 for i in range(10):
     try:
-        res = requests.get(f"{API_URL}/students")
+        res = requests.get(f"{API_URL}/students?limit=1")
         res.raise_for_status()
         st.success("✅ Connected to API")
         break
@@ -30,21 +30,71 @@ choice = st.sidebar.selectbox("Menu", menu)
 
 # --- Helper: Fetch Students ---
 def fetch_students():
+    """All students, following X-Next-Cursor through every page."""
     try:
-        res = requests.get(f"{API_URL}/students")
-        res.raise_for_status()
-        data = res.json()
-        if not data:
+        # revalidate each page's last response instead of downloading it again
+        cached_pages = st.session_state.setdefault("students_pages", {})
+        # column arrays build the DataFrame much faster than a list of dicts;
+        # servers without the table format answer with plain JSON rows
+        accept = "application/vnd.table+json, application/json;q=0.9"
+        frames = []
+        cursor = None
+        while True:
+            url = f"{API_URL}/students?limit=1000" + (f"&cursor={cursor}" if cursor else "")
+            cached = cached_pages.get(url)
+            headers = {"Accept": accept}
+            if cached is not None:
+                headers["If-None-Match"] = cached.headers["ETag"]
+            res = requests.get(url, headers=headers)
+            if res.status_code == 304:
+                res = cached
+            res.raise_for_status()
+            if "ETag" in res.headers:
+                cached_pages[url] = res
+            frames.append(pd.DataFrame(res.json()))
+            cursor = res.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        df = pd.concat(frames, ignore_index=True)
+        if df.empty:
             st.info("No students in the database.")
-        return pd.DataFrame(data)
+        return df
     except Exception as e:
         st.error(f"Error fetching students: {e}")
         return pd.DataFrame()
 
+# --- Helper: Fetch Score Columns ---
+def fetch_scores():
+    """Score columns from the Arrow endpoint, falling back to fetch_students."""
+    try:
+        import pyarrow as pa
+        cached = st.session_state.get("scores_response")
+        headers = {"If-None-Match": cached.headers["ETag"]} if cached is not None else {}
+        res = requests.get(f"{API_URL}/analytics/students.arrow", headers=headers)
+        if res.status_code == 304:
+            res = cached
+        res.raise_for_status()
+        st.session_state["scores_response"] = res
+        return pa.ipc.open_stream(res.content).read_pandas()
+    except Exception:
+        # no pyarrow here, or a server without the endpoint
+        return fetch_students()
+
+# --- Helper: Fetch Weak-Subject Counts ---
+def fetch_weak_subjects(course):
+    """Server-side weak-subject counts for the cohort or one course, None if unavailable."""
+    path = "/insights" if course == "All" else f"/courses/{course}/insights"
+    try:
+        res = requests.get(f"{API_URL}{path}", timeout=5)
+        res.raise_for_status()
+        return res.json().get("weak_subjects")
+    except Exception:
+        return None
+
 # --- DASHBOARD ---
 if choice == "Dashboard":
     st.subheader("📊 Dashboard & Analytics")
-    df = fetch_students()
+    df = fetch_scores()
     if df.empty:
         st.stop()
 
@@ -112,15 +162,18 @@ if choice == "Dashboard":
 
     # --- Weak Subjects Insight ---
     st.subheader("Weak Subjects Insight")
-    filtered_df['weak_math'] = filtered_df['math'] < filtered_df['avg']
-    filtered_df['weak_science'] = filtered_df['science'] < filtered_df['avg']
-    filtered_df['weak_english'] = filtered_df['english'] < filtered_df['avg']
-
-    weak_counts = {
-        'Math': filtered_df['weak_math'].sum(),
-        'Science': filtered_df['weak_science'].sum(),
-        'English': filtered_df['weak_english'].sum()
-    }
+    # the server only aggregates by course, so a grade filter is still counted here
+    weak_counts = fetch_weak_subjects(selected_course) if selected_grade == "All" else None
+    if weak_counts is None:
+        filtered_df['weak_math'] = filtered_df['math'] < filtered_df['avg']
+        filtered_df['weak_science'] = filtered_df['science'] < filtered_df['avg']
+        filtered_df['weak_english'] = filtered_df['english'] < filtered_df['avg']
+
+        weak_counts = {
+            'Math': filtered_df['weak_math'].sum(),
+            'Science': filtered_df['weak_science'].sum(),
+            'English': filtered_df['weak_english'].sum()
+        }
     weak_df = pd.DataFrame(list(weak_counts.items()), columns=['Subject','Count'])
     chart_weak = alt.Chart(weak_df).mark_bar(color="#E91E63").encode(
         x='Subject',
@@ -1,17 +1,239 @@
 # database.py
-from sqlalchemy import create_engine
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
-from typing import Generator
+from typing import AsyncGenerator, Generator, List, Optional, Tuple
 
-DATABASE_URL = "sqlite:///./students.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./students.db")
+
+# SQLite tuning, see https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # negative = KiB, so -65536 is a 64 MiB page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+
+# sync endpoints run on AnyIO's threadpool (40 workers), one connection each
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": True}
+
+    if url.startswith("sqlite"):
+        if "aiosqlite" not in url:
+            options["connect_args"] = {"check_same_thread": False}
+        if url.partition("://")[2].strip("/") in ("", ":memory:"):
+            # in-memory DBs live in one connection, the default pool handles that
+            options.pop("pool_pre_ping")
+            return options
+
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+def create_db_engine(url: str = DATABASE_URL, **kwargs) -> Engine:
+    """
+    Engine factory. File-backed SQLite gets WAL and the pragmas above on
+    every new connection, and all backends get a sized, pre-pinged pool.
+    """
+    options = {"future": True, **_engine_options(url), **kwargs}
+    new_engine = create_engine(url, **options)
+
+    if url.startswith("sqlite"):
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+def async_database_url(url: str) -> str:
+    """Async driver equivalent of a sync URL (aiosqlite / asyncpg)."""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+")[0]
+    drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+    return drivers.get(backend, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_database_url(DATABASE_URL))
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, **kwargs) -> AsyncEngine:
+    """Async counterpart of create_db_engine, same pool sizing and pragmas."""
+    new_engine = create_async_engine(url, **{**_engine_options(url), **kwargs})
+    if url.startswith("sqlite"):
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_db_engine()
+
+
+# ---------------------- Read replicas ----------------------
+# Comma separated URLs. Reads done through crud's read-only functions go to
+# a replica; writes, and a client's reads shortly after its own write, go to
+# the primary.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# read-your-writes window: replicas are skipped for this long after a commit
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "2"))
+# carries the time of the client's last write (epoch seconds) between requests
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+replica_engines: List[Engine] = [create_db_engine(url) for url in DATABASE_REPLICA_URLS]
+# fallback for requests without the cookie or header: any write in this process
+_last_write = 0.0
+# set by ReadYourWritesMiddleware: the client's last write, and the commits of this request
+_client_last_write: ContextVar[Optional[float]] = ContextVar("client_last_write", default=None)
+_request_writes: ContextVar[Optional[list]] = ContextVar("request_writes", default=None)
+
+
+@contextmanager
+def replica_reads(db):
+    """Allow statements run on `db` inside this block to use a read replica."""
+    db.info["replica_reads"] = db.info.get("replica_reads", 0) + 1
+    try:
+        yield db
+    finally:
+        db.info["replica_reads"] -= 1
+
+
+def _wrote_recently() -> bool:
+    client = _client_last_write.get()
+    if client is not None:
+        return time.time() - client < REPLICA_STICKY_SECONDS
+    return time.monotonic() - _last_write < REPLICA_STICKY_SECONDS
+
+
+class RoutingSession(Session):
+    """
+    Session that picks the primary or a replica per statement. A session
+    sticks to one replica, and to the primary once it has written.
+    """
+
+    def _engines(self) -> Tuple[Engine, List[Engine]]:
+        return engine, replica_engines
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary, replicas = self._engines()
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+            return primary
+        if (
+            not replicas
+            or not self.info.get("replica_reads")
+            or self.info.get("wrote")
+            or _wrote_recently()
+        ):
+            return primary
+        if "replica" not in self.info:
+            self.info["replica"] = random.randrange(len(replicas))
+        return replicas[self.info["replica"]]
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_write(session):
+    global _last_write
+    if session.info.pop("wrote", False):
+        _last_write = time.monotonic()
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.append(time.time())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+def _parse_last_write(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Scopes the read-your-writes window to the client. A response to a
+    request that committed a write carries its time in the last_write
+    cookie and the X-Last-Write header; requests sending either back read
+    from the primary for REPLICA_STICKY_SECONDS after their own writes only.
+    Requests with neither (a client's first, or clients that keep no
+    cookies) fall back to the process-wide window.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        last_write = _parse_last_write(headers.get(LAST_WRITE_HEADER.lower().encode(), b"").decode("latin-1"))
+        if last_write is None and b"cookie" in headers:
+            morsel = SimpleCookie(headers[b"cookie"].decode("latin-1")).get(LAST_WRITE_COOKIE)
+            last_write = _parse_last_write(morsel.value if morsel else None)
+        writes: list = []
+        client_token = _client_last_write.set(last_write)
+        writes_token = _request_writes.set(writes)
+
+        async def send_with_last_write(message):
+            # the response starts once the endpoint has returned, so its commits are recorded
+            if message["type"] == "http.response.start" and (writes or last_write is None):
+                # clients without one get "0" (no writes yet), so they leave the process-wide fallback
+                value = repr(max(writes)).encode() if writes else b"0"
+                extra = [(b"set-cookie", LAST_WRITE_COOKIE.encode() + b"=" + value + b"; Path=/; HttpOnly; SameSite=Lax")]
+                if writes:
+                    extra.append((LAST_WRITE_HEADER.lower().encode(), value))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_last_write)
+        finally:
+            _client_last_write.reset(client_token)
+            _request_writes.reset(writes_token)
+
+
+def copy_sqlite_replica(replica_url: str, primary_url: str = DATABASE_URL) -> None:
+    """
+    Local stand-in for replication: snapshot a SQLite primary into a
+    replica file with the online backup API.
+    """
+    source = sqlite3.connect(make_url(primary_url).database)
+    target = sqlite3.connect(make_url(replica_url).database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    future=True
-)
 
 SessionLocal = sessionmaker(
+    class_=RoutingSession,
     autocommit=False,
     autoflush=False,
     bind=engine,
@@ -29,3 +251,44 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+# The async engine is created on first use so the sync-only scripts don't
+# need aiosqlite/asyncpg installed
+_async_engine: Optional[AsyncEngine] = None
+_async_replica_engines: List[AsyncEngine] = []
+_AsyncSessionLocal: Optional[async_sessionmaker] = None
+
+
+class AsyncRoutingSession(RoutingSession):
+    """RoutingSession behind AsyncSession, routes between the async engines."""
+
+    def _engines(self) -> Tuple[Engine, List[Engine]]:
+        return _async_engine.sync_engine, [e.sync_engine for e in _async_replica_engines]
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_replica_engines, _AsyncSessionLocal
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+        _async_replica_engines = [create_async_db_engine(async_database_url(url)) for url in DATABASE_REPLICA_URLS]
+        _AsyncSessionLocal = async_sessionmaker(
+            bind=_async_engine,
+            sync_session_class=AsyncRoutingSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    get_async_engine()
+    return _AsyncSessionLocal()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async alternative to get_db, for `async def` endpoints.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
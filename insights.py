@@ -0,0 +1,201 @@
+# insights.py
+# Cohort- and course-level insights computed in one vectorized pass over the
+# score columns. The result is cached per process and keyed on the students
+# change counter, so lookups between writes are dictionary hits.
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import crud
+import ml_model
+import models
+from database import replica_reads
+
+SUBJECTS = ["math", "science", "english"]
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def _round(values) -> list:
+    return [round(float(v), 2) for v in values]
+
+
+class InsightsSnapshot:
+    """Insights for every student and course at one data version."""
+
+    def __init__(self, version: int, ids, courses, scores, attendance):
+        self.version = version
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=float).reshape(-1, len(SUBJECTS))
+        self.attendance = np.asarray(attendance, dtype=float)
+        self.total = self.scores.sum(axis=1)
+        self.average = self.total / len(SUBJECTS)
+        self.index = {student_id: i for i, student_id in enumerate(self.ids.tolist())}
+
+        self.course_names, self.codes = np.unique(np.asarray(courses, dtype=str), return_inverse=True)
+        self.cohort = None
+        self.courses = {}
+        if not len(self.ids):
+            return
+
+        # same weak-subject / attendance rules as ai_insights, as a 4-bit mask per student
+        weak = self.scores < np.round(self.average, 2)[:, None]
+        self.mask = weak @ np.array([1, 2, 4]) + (self.attendance < ml_model.LOW_ATTENDANCE) * 8
+
+        self.grade = np.array(models.GRADES)[np.searchsorted(models.GRADE_CUTOFFS, self.average, side="right")]
+        self._percentile_ranks()
+
+        # sort once by (course, total); each course is then a contiguous slice
+        order = np.lexsort((self.total, self.codes))
+        starts = np.searchsorted(self.codes[order], np.arange(len(self.course_names)))
+        ends = np.append(starts[1:], len(order))
+        self.cohort = self._summary(np.arange(len(self.ids)))
+        self.courses = {
+            course: self._summary(order[start:end])
+            for course, start, end in zip(self.course_names.tolist(), starts, ends)
+        }
+
+        # per-student z-scores against their course
+        means = np.array([self.courses[c]["_mean"] for c in self.course_names.tolist()]).reshape(-1, len(SUBJECTS))
+        stds = np.array([self.courses[c]["_std"] for c in self.course_names.tolist()]).reshape(-1, len(SUBJECTS))
+        std = stds[self.codes]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.z = np.where(std > 0, (self.scores - means[self.codes]) / std, 0.0)
+        p25 = np.array([self.courses[c]["_p25"] for c in self.course_names.tolist()]).reshape(-1, len(SUBJECTS))
+        self.below_p25 = self.scores < p25[self.codes]
+
+        # how far each course's subject means sit from the cohort, in cohort standard deviations
+        cohort_mean, cohort_std = self.cohort["_mean"], self.cohort["_std"]
+        for course in self.courses.values():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                diff = np.where(cohort_std > 0, (course["_mean"] - cohort_mean) / cohort_std, 0.0)
+            course["vs_cohort_z"] = dict(zip(SUBJECTS, _round(diff)))
+
+    def _percentile_ranks(self) -> None:
+        """Percentile rank of each total in the cohort and in its course, ties counted as half."""
+        n = len(self.total)
+        sorted_total = np.sort(self.total)
+        less = np.searchsorted(sorted_total, self.total, side="left")
+        equal = np.searchsorted(sorted_total, self.total, side="right") - less
+        self.cohort_pct = 100.0 * (less + 0.5 * equal) / n
+
+        # one composite key orders by course, then total
+        shifted = self.total - self.total.min()
+        key = self.codes * (shifted.max() + 1.0) + shifted
+        sorted_key = np.sort(key)
+        counts = np.bincount(self.codes)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        less = np.searchsorted(sorted_key, key, side="left") - starts[self.codes]
+        equal = np.searchsorted(sorted_key, key, side="right") - starts[self.codes] - less
+        self.course_pct = 100.0 * (less + 0.5 * equal) / counts[self.codes]
+
+    def _summary(self, rows) -> Dict:
+        scores = self.scores[rows]
+        count = len(rows)
+        mean = scores.mean(axis=0)
+        std = scores.std(axis=0)
+        columns = {"total": self.total[rows], **{s: scores[:, j] for j, s in enumerate(SUBJECTS)}}
+        percentiles = {
+            name: dict(zip([f"p{p}" for p in PERCENTILES], _round(np.percentile(values, PERCENTILES))))
+            for name, values in columns.items()
+        }
+        weak = np.bitwise_and.outer(self.mask[rows], [1, 2, 4]) > 0
+        total = self.total[rows]
+        attendance = self.attendance[rows]
+        return {
+            "count": count,
+            "mean": dict(zip(SUBJECTS + ["total", "attendance"], _round([*mean, total.mean(), attendance.mean()]))),
+            "std": dict(zip(SUBJECTS + ["total"], _round([*std, total.std()]))),
+            "percentiles": percentiles,
+            # students below their own average in each subject (ai_insights' weak subjects)
+            "weak_subjects": dict(zip(ml_model.SUBJECTS, weak.sum(axis=0).tolist())),
+            "low_attendance": int((attendance < ml_model.LOW_ATTENDANCE).sum()),
+            "grades": {str(g): int(n) for g, n in zip(*np.unique(self.grade[rows], return_counts=True))},
+            "_mean": mean,
+            "_std": std,
+            "_p25": np.percentile(scores, 25, axis=0),
+        }
+
+    @staticmethod
+    def _public(summary: Dict) -> Dict:
+        return {k: v for k, v in summary.items() if not k.startswith("_")}
+
+    def student(self, student_id: int) -> Optional[Dict]:
+        i = self.index.get(student_id)
+        if i is None:
+            return None
+        course = str(self.course_names[self.codes[i]])
+        mask = int(self.mask[i])
+        return {
+            "id": student_id,
+            "course": course,
+            "data_version": self.version,
+            "average": round(float(self.average[i]), 2),
+            "total": round(float(self.total[i]), 2),
+            "grade": str(self.grade[i]),
+            "percentile": {
+                "cohort": round(float(self.cohort_pct[i]), 2),
+                "course": round(float(self.course_pct[i]), 2),
+            },
+            "z_scores": dict(zip(SUBJECTS, _round(self.z[i]))),
+            "below_course_p25": [s for s, below in zip(SUBJECTS, self.below_p25[i]) if below],
+            "weak_subjects": ml_model.WEAK_SUBJECTS_BY_MASK[mask],
+            "suggestions": [ml_model.SUGGESTIONS[code] for code in ml_model.SUGGESTIONS_BY_MASK[mask]],
+            "course_size": self.courses[course]["count"],
+        }
+
+    def course(self, course: str) -> Optional[Dict]:
+        summary = self.courses.get(course)
+        if summary is None:
+            return None
+        return {"course": course, "data_version": self.version, **self._public(summary)}
+
+    def cohort_summary(self) -> Dict:
+        return {
+            "data_version": self.version,
+            "courses": self.course_names.tolist(),
+            **(self._public(self.cohort) if self.cohort is not None else {"count": 0}),
+        }
+
+
+def build_snapshot(db: Session) -> InsightsSnapshot:
+    S = models.Student
+    # version first: a write landing in between only makes the data newer
+    # than its label, and the snapshot is rebuilt on the next lookup
+    version = crud.table_version(db)
+    with replica_reads(db):
+        rows = db.execute(
+            select(
+                S.id, S.course,
+                func.coalesce(S.math, 0.0), func.coalesce(S.science, 0.0), func.coalesce(S.english, 0.0),
+                func.coalesce(S.attendance, 100.0),
+            )
+        ).all()
+    if not rows:
+        return InsightsSnapshot(version, [], [], np.zeros((0, len(SUBJECTS))), [])
+    ids, courses, math, science, english, attendance = zip(*rows)
+    return InsightsSnapshot(version, ids, courses, np.column_stack([math, science, english]), attendance)
+
+
+class InsightsEngine:
+    """Per-process cache of the latest InsightsSnapshot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[InsightsSnapshot] = None
+
+    def snapshot(self, db: Session) -> InsightsSnapshot:
+        current = crud.table_version(db)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == current:
+            return snapshot
+        with self._lock:
+            # another thread may have rebuilt it while we waited
+            if self._snapshot is None or self._snapshot.version != current:
+                self._snapshot = build_snapshot(db)
+            return self._snapshot
+
+
+engine = InsightsEngine()
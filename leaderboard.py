@@ -0,0 +1,184 @@
+# leaderboard.py
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+
+
+class SortedScores:
+    """
+    Sorted multiset of scores split into buckets of ~LOAD items, so inserts,
+    deletes and rank queries cost O(sqrt n) instead of shifting one big list.
+    """
+
+    LOAD = 1000
+
+    def __init__(self):
+        self._buckets: List[List[float]] = []
+        self._maxes: List[float] = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, value: float) -> None:
+        if not self._buckets:
+            self._buckets.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            return
+
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            i -= 1
+        bucket = self._buckets[i]
+        insort(bucket, value)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+
+    def remove(self, value: float) -> None:
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            raise ValueError(f"{value} not in SortedScores")
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, value)
+        if j == len(bucket) or bucket[j] != value:
+            raise ValueError(f"{value} not in SortedScores")
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def count_greater(self, value: float) -> int:
+        i = bisect_right(self._maxes, value)
+        if i == len(self._buckets):
+            return 0
+        bucket = self._buckets[i]
+        return len(bucket) - bisect_right(bucket, value) + sum(len(b) for b in self._buckets[i + 1:])
+
+    def count_less(self, value: float) -> int:
+        i = bisect_left(self._maxes, value)
+        below = sum(len(b) for b in self._buckets[:i])
+        if i < len(self._buckets):
+            below += bisect_left(self._buckets[i], value)
+        return below
+
+
+def _position(scores: SortedScores, total: float) -> Dict:
+    size = len(scores)
+    greater = scores.count_greater(total)
+    less = scores.count_less(total)
+    equal = size - greater - less
+    return {
+        "rank": greater + 1,
+        "out_of": size,
+        # percentile rank: share of students below, counting ties as half
+        "percentile": round(100.0 * (less + 0.5 * equal) / size, 2),
+    }
+
+
+class Leaderboard:
+    """
+    In-process order-statistics index over Student.total, overall and per
+    course, tagged with the students table version it reflects. A lookup
+    rebuilds it from the DB when the version moved on (a write from another
+    process); this process's own writes are applied in place.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._students: Dict[int, Tuple[str, float]] = {}
+        self._all = SortedScores()
+        self._by_course: Dict[str, SortedScores] = {}
+
+    def _insert(self, student_id: int, course: str, total: float) -> None:
+        self._students[student_id] = (course, total)
+        self._all.add(total)
+        self._by_course.setdefault(course, SortedScores()).add(total)
+
+    def _delete(self, student_id: int) -> None:
+        entry = self._students.pop(student_id, None)
+        if entry is None:
+            return
+        course, total = entry
+        self._all.remove(total)
+        course_scores = self._by_course[course]
+        course_scores.remove(total)
+        if not len(course_scores):
+            del self._by_course[course]
+
+    def ensure_loaded(self, db: Session, version: int) -> None:
+        """
+        Rebuild unless the index is at `version`. Read the version before
+        calling: rows newer than it only cause one more rebuild, rows older
+        than it would be kept as current.
+        """
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            rows = db.query(models.Student.id, models.Student.course, models.Student.total).all()
+            self._students = {}
+            self._all = SortedScores()
+            self._by_course = {}
+            for student_id, course, total in rows:
+                self._insert(student_id, course, total or 0.0)
+            self._version = version
+
+    def reset(self) -> None:
+        """Drop the index, it is rebuilt from the DB on the next lookup."""
+        with self._lock:
+            self._version = None
+
+    def _apply(self, version: int, change) -> None:
+        # every write bumps the table version by one; a gap means a write
+        # this process didn't see, so rebuild rather than patch
+        with self._lock:
+            if self._version is None:
+                return
+            if self._version != version - 1:
+                self._version = None
+                return
+            change()
+            self._version = version
+
+    def add(self, student_id: int, course: str, total: float, version: int) -> None:
+        """Apply a committed insert or update; `version` is the table version it committed as."""
+        def change():
+            self._delete(student_id)
+            self._insert(student_id, course, total or 0.0)
+        self._apply(version, change)
+
+    update = add
+
+    def remove(self, student_id: int, version: int) -> None:
+        self._apply(version, lambda: self._delete(student_id))
+
+    def rank(self, student_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._students.get(student_id)
+            if entry is None:
+                return None
+            course, total = entry
+            return {
+                "id": student_id,
+                "course": course,
+                "total": total,
+                "overall": _position(self._all, total),
+                "in_course": _position(self._by_course[course], total),
+            }
+
+
+board = Leaderboard()
@@ -1,15 +1,64 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import crud, models, schemas
-from database import engine, get_db
+from contextlib import asynccontextmanager
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import crud, crud_async, metrics, migrations, models, photo_store, profiler, query_debug, schemas, serialization
+from cache import COURSE_STATS_TAG, response_cache, student_tag, top_tag
+from database import (
+    AsyncSessionLocal, ReadYourWritesMiddleware, SessionLocal, engine, get_async_db, get_async_engine, get_db,
+    replica_engines, replica_reads,
+)
+from middleware import CompressionMiddleware, UploadSizeLimitMiddleware
 from ml_model import predict_grade, ai_insights
-from typing import List
+import insights
+import ml_model
+import model_registry
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
+# the db.Model tables (student, course_stats, table_versions, student_changes)
+models.db.metadata.create_all(bind=engine)
+# columns added to tables that already existed
+migrations.upgrade(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if crud.MATERIALIZED_COURSE_STATS:
+        # the table isn't maintained while the flag is off, start from a fresh copy
+        with SessionLocal() as db:
+            crud.rebuild_course_stats(db)
+    with SessionLocal() as db:
+        crud.prune_student_changes(db)
+    try:
+        model_registry.registry.load_active()
+    except Exception:
+        # keep serving with the threshold ladder rather than failing startup
+        logger.exception("Could not load the active grade model")
+    model_registry.registry.batcher.start()
+    yield
+    await model_registry.registry.batcher.stop()
 
-app = FastAPI(title="Student Management API")
+
+app = FastAPI(title="Student Management API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -19,65 +68,556 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for responses of COMPRESSION_MIN_BYTES and up
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
+
+# Refuse oversized photo uploads before the multipart body is spooled
+# (the extra 64 KiB leaves room for the multipart envelope)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=photo_store.MAX_PHOTO_BYTES + 64 * 1024)
+
+# Send a client's reads to the primary only after its own writes
+if replica_engines:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+# QUERY_DEBUG=1: log each request's SQL with call sites, flag requests over budget
+if query_debug.QUERY_DEBUG:
+    query_debug.instrument_engine(engine, "primary")
+    for i, replica in enumerate(replica_engines):
+        query_debug.instrument_engine(replica, f"replica{i}")
+    query_debug.instrument_engine(get_async_engine().sync_engine, "async")
+    app.add_middleware(query_debug.QueryDebugMiddleware)
+
+# Lets a running profile tag event loop samples with the request's route
+app.add_middleware(profiler.ProfilerMiddleware, profiler=profiler.profiler)
+
+# Outermost, so request latency and response size include compression
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(engine, "primary")
+    for i, replica in enumerate(replica_engines):
+        metrics.instrument_engine(replica, f"replica{i}")
+    metrics.instrument_engine(get_async_engine().sync_engine, "async")
+    app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get("/")
 def root():
     return {"message": "API running"}
 
+# ---------------------- Bulk -------------------------
+# Declared before the /students/{student_id} routes so "bulk" isn't read as an id
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+async def _iter_lines(request: Request):
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line
+    if buf:
+        yield buf
+
+
+async def _iter_import_rows(request: Request):
+    """
+    Yield (obj, error) for every row of a JSON array, NDJSON or CSV body.
+    NDJSON and CSV are parsed line by line as the body streams in.
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+
+    if content_type in NDJSON_TYPES:
+        async for line in _iter_lines(request):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, f"Invalid JSON: {e}"
+
+    elif content_type == "text/csv":
+        header = None
+        async for line in _iter_lines(request):
+            text = line.decode("utf-8-sig" if header is None else "utf-8").rstrip("\r")
+            if not text.strip():
+                continue
+            values = next(csv.reader([text]))
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            if len(values) != len(header):
+                yield None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            # empty cells count as missing
+            yield {k: v for k, v in zip(header, values) if v != ""}, None
+
+    elif content_type == "application/json":
+        try:
+            data = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of students")
+        for obj in data:
+            yield obj, None
+
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+@app.post("/students/bulk")
+async def bulk_create_students(
+    request: Request,
+    chunk_size: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """
+    Import students from a JSON array, NDJSON or CSV body. Rows are inserted
+    in chunks of `chunk_size`, one transaction per chunk; invalid and
+    duplicate rows are skipped and reported by row number (1-based).
+    """
+
+    inserted = 0
+    errors = []
+    chunk = []
+
+    async def flush():
+        nonlocal inserted, chunk
+        # DB work runs in the threadpool, off the event loop
+        n, errs = await run_in_threadpool(crud.bulk_create_students, db, chunk)
+        inserted += n
+        errors.extend(errs)
+        chunk = []
+
+    row = 0
+    async for obj, error in _iter_import_rows(request):
+        row += 1
+        if error is None:
+            try:
+                chunk.append((row, schemas.StudentImport.model_validate(obj)))
+            except ValidationError as e:
+                error = _validation_message(e)
+        if error is not None:
+            errors.append({"row": row, "error": error})
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+
+    if chunk:
+        await flush()
+
+    errors.sort(key=lambda e: e["row"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+
+@app.patch("/students/bulk")
+def bulk_update_students(updates: List[schemas.StudentBulkUpdate], db: Session = Depends(get_db)):
+    return {"updated": crud.bulk_update_students(db, updates)}
+
+
+@app.delete("/students/bulk")
+def bulk_delete_students(payload: schemas.StudentBulkDelete, db: Session = Depends(get_db)):
+    return {"deleted": crud.bulk_delete_students(db, payload.ids)}
+
+
+# ---------------------- Export -------------------------
+
+EXPORT_COLUMNS = ["id", "name", "course", "math", "science", "english", "attendance", "total", "grade"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file for pyarrow that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _export_csv(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def _export_ndjson(batches):
+    for rows in batches:
+        yield b"".join(serialization.dumps(obj) + b"\n" for obj in serialization.rows_to_dicts(EXPORT_COLUMNS, rows))
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()), ("name", pa.string()), ("course", pa.string()),
+        ("math", pa.float64()), ("science", pa.float64()), ("english", pa.float64()),
+        ("attendance", pa.float64()), ("total", pa.float64()), ("grade", pa.string()),
+    ])
+
+
+def _record_batch(rows, schema):
+    """Row tuples -> RecordBatch, one pa.array per column (no per-row dicts)."""
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+    )
+
+
+def _export_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    # one row group per DB batch, flushed to the client as soon as it is written
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_batches([_record_batch(rows, schema)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _export_arrow(batches):
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.drain()
+        for rows in batches:
+            writer.write_batch(_record_batch(rows, schema))
+            yield sink.drain()
+    # end-of-stream marker
+    yield sink.drain()
+
+
+EXPORTERS = {"csv": _export_csv, "ndjson": _export_ndjson, "parquet": _export_parquet}
+
+
+@app.get("/students/export")
+def export_students(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+):
+
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+
+    def stream():
+        # own session: the response body is produced after the handler returns
+        with SessionLocal() as db:
+            batches = crud.iter_students(db, EXPORT_COLUMNS, EXPORT_BATCH_SIZE, course=course, grade=grade)
+            yield from EXPORTERS[format](batches)
+
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="students.{format}"'},
+    )
+
+
+# Score columns for the dashboards as an Arrow IPC stream: record batches are
+# built column-wise from the DB cursor and read zero-copy by pyarrow/pandas
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ANALYTICS_BATCH_SIZE = 10000
+
+
+@app.get("/analytics/students.arrow")
+def analytics_students_arrow(request: Request, course: Optional[str] = None, grade: Optional[str] = None):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Arrow output requires pyarrow")
+
+    with SessionLocal() as db:
+        etag = _etag("analytics", crud.table_version(db), course, grade)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+    def stream():
+        with SessionLocal() as db:
+            with replica_reads(db):
+                yield from _export_arrow(
+                    crud.iter_students(db, EXPORT_COLUMNS, ANALYTICS_BATCH_SIZE, course=course, grade=grade)
+                )
+
+    return StreamingResponse(stream(), media_type=ARROW_STREAM_MEDIA_TYPE, headers=_etag_headers(etag))
+
+
+# ---------------------- Change feed -------------------------
+# A client calls /students/changes without `since` to get the current
+# cursor, loads /students once, then applies deltas polled (or streamed)
+# from that cursor. Upserts carry the full row, so replaying an
+# overlapping window is harmless.
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_KEEPALIVE_SECONDS = 15.0
+CHANGE_FEED_BATCH = 1000
+
+
+def _change_page(changes, since: int, limit: int):
+    if changes is None:
+        raise HTTPException(status_code=410, detail="Cursor is older than the change log, reload /students")
+    return {
+        "cursor": changes[-1][0] if changes else since,
+        "has_more": len(changes) == limit,
+        "changes": [
+            {
+                "op": op,
+                "id": student_id,
+                "student": serialization.student_dict(s) if s is not None else None,
+            }
+            for _, op, student_id, s in changes
+        ],
+    }
+
+
+@app.get("/students/changes")
+async def student_changes(
+    since: Optional[int] = Query(None, ge=0, description="Cursor returned by the previous call"),
+    limit: int = Query(CHANGE_FEED_BATCH, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if since is None:
+        return {"cursor": await crud_async.change_cursor(db), "has_more": False, "changes": []}
+    return _change_page(await crud_async.student_changes(db, since, limit), since, limit)
+
+
+def _sse(event: str, data, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _change_events(request: Request, since: Optional[int]):
+    if since is None:
+        async with AsyncSessionLocal() as db:
+            since = await crud_async.change_cursor(db)
+        yield _sse("cursor", {"cursor": since}, since)
+
+    idle = 0.0
+    while not await request.is_disconnected():
+        # short-lived sessions, a stream can stay open for hours
+        async with AsyncSessionLocal() as db:
+            changes = await crud_async.student_changes(db, since, CHANGE_FEED_BATCH)
+        try:
+            page = _change_page(changes, since, CHANGE_FEED_BATCH)
+        except HTTPException as e:
+            yield _sse("expired", {"detail": e.detail})
+            return
+
+        if page["changes"]:
+            since = page["cursor"]
+            yield _sse("changes", page, since)
+            idle = 0.0
+            if page["has_more"]:
+                continue
+        elif idle >= CHANGE_FEED_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            idle = 0.0
+
+        await asyncio.sleep(CHANGE_FEED_POLL_SECONDS)
+        idle += CHANGE_FEED_POLL_SECONDS
+
+
+@app.get("/students/changes/stream")
+async def stream_student_changes(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """Server-sent events version of /students/changes; resumes from Last-Event-ID."""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+
+    return StreamingResponse(
+        _change_events(request, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------------- Conditional requests -------------------------
+# Read endpoints send strong ETags derived from row versions or the
+# students table change counter, so a current client gets a 304 without
+# any row data being read.
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison: CompressionMiddleware hands out W/ versions of our ETags
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return etag.removeprefix("W/") in tags or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _etag(*parts) -> str:
+    """Strong ETag over a data version and whatever else shapes the body."""
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:32] + '"'
+
+
+def _etag_headers(etag: str) -> dict:
+    # no-cache: clients may store the body but must revalidate it
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _json_bytes(body: bytes, etag: Optional[str] = None, status_code: int = 200) -> Response:
+    """Response for an already serialized (e.g. cached) JSON body."""
+    headers = _etag_headers(etag) if etag else None
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
 # ---------------------- CRUD -------------------------
 
+
 @app.post("/students", response_model=schemas.StudentOut, status_code=status.HTTP_201_CREATED)
-def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
+async def create_student(student: schemas.StudentCreate, db: AsyncSession = Depends(get_async_db)):
+
+    s = await crud_async.create_student(db, student)
+    return _json_bytes(serialization.student_json(s), status_code=status.HTTP_201_CREATED)
 
-    s = crud.create_student(db, student)
-    out = schemas.StudentOut.model_validate(s).model_dump()
-    
-    # add base64 image
-    out["photo"] = s.photo_base64()
-    return out
+
+STUDENT_FIELDS = serialization.STUDENT_FIELDS
+# photo_url is derived from id + photo_hash, everything else is a column
+STUDENT_COLUMNS = [f for f in STUDENT_FIELDS if f != "photo_url"]
 
 
 @app.get("/students", response_model=List[schemas.StudentOut])
-def get_students(db: Session = Depends(get_db)):
+async def get_students(
+    request: Request,
+    cursor: Optional[int] = Query(None, description="Return students with id greater than this"),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    course: Optional[str] = None,
+    grade: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in STUDENT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        selected = STUDENT_FIELDS
+
+    media_type = serialization.negotiate(request.headers.get("accept"))
+    etag = _etag("students", await crud_async.table_version(db), sorted(request.query_params.multi_items()), media_type)
+    headers = {**_etag_headers(etag), "Vary": "Accept"}
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    students = crud.get_students(db)
-    out = []
+    # id is always needed for the cursor
+    columns = ["id"] + [f for f in STUDENT_COLUMNS if f in selected and f != "id"]
+    if "photo_url" in selected and "photo_hash" not in columns:
+        columns.append("photo_hash")
 
-    for s in students:
-        obj = schemas.StudentOut.model_validate(s).model_dump()
-        obj["photo"] = s.photo_base64()
-        out.append(obj)
+    rows = await crud_async.get_students(
+        db,
+        after_id=cursor,
+        limit=limit,
+        fields=columns,
+        course=course,
+        grade=grade,
+        min_total=min_total,
+        max_total=max_total,
+    )
 
-    return out
+    out = serialization.rows_to_dicts(columns, rows)
+    if "photo_url" in selected:
+        keep_hash = "photo_hash" in selected
+        for obj in out:
+            obj["photo_url"] = models.photo_url(obj["id"], obj["photo_hash"] if keep_hash else obj.pop("photo_hash"))
+
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = str(out[-1]["id"])
+
+    # Rows are already shaped, skip response_model re-validation
+    out_columns = [c for c in columns if c != "photo_hash" or "photo_hash" in selected]
+    if "photo_url" in selected:
+        out_columns.append("photo_url")
+    body = serialization.encode_records(out, out_columns, media_type)
+    return Response(body, media_type=media_type, headers=headers)
 
 
 @app.get("/students/{student_id}", response_model=schemas.StudentOut)
-def get_student(student_id: int, db: Session = Depends(get_db)):
+async def get_student(student_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
 
-    s = crud.get_student(db, student_id)
-    if not s:
+    version = await crud_async.student_version(db, student_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Student not found")
+    etag = _etag("student", student_id, version)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
 
-    obj = schemas.StudentOut.model_validate(s).model_dump()
-    obj["photo"] = s.photo_base64()
-    return obj
+    # the version in the key keeps cached bodies in step with the ETag
+    key, tags = f"student:{student_id}:{version}", [student_tag(student_id)]
+    body = await response_cache.aget(key, tags)
+    if body is None:
+        s = await crud_async.get_student(db, student_id)
+        if not s:
+            raise HTTPException(status_code=404, detail="Student not found")
+        body = serialization.student_json(s)
+        await response_cache.aset(key, body, tags)
+
+    return _json_bytes(body, etag)
 
 
 @app.put("/students/{student_id}", response_model=schemas.StudentOut)
-def update_student(student_id: int, student_in: schemas.StudentCreate, db: Session = Depends(get_db)):
+async def update_student(student_id: int, student_in: schemas.StudentCreate, db: AsyncSession = Depends(get_async_db)):
 
-    s = crud.update_student(db, student_id, student_in)
+    s = await crud_async.update_student(db, student_id, student_in)
     if not s:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    obj = schemas.StudentOut.model_validate(s).model_dump()
-    obj["photo"] = s.photo_base64()
-    return obj
+    return _json_bytes(serialization.student_json(s))
 
 
 @app.delete("/students/{student_id}")
-def delete_student(student_id: int, db: Session = Depends(get_db)):
+async def delete_student(student_id: int, db: AsyncSession = Depends(get_async_db)):
 
-    ok = crud.delete_student(db, student_id)
+    ok = await crud_async.delete_student(db, student_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Student not found")
 
@@ -86,23 +626,161 @@ def delete_student(student_id: int, db: Session = Depends(get_db)):
 
 # ---------------------- Photo Upload -------------------------
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
 @app.post("/students/{student_id}/photo")
-async def upload_photo(student_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+def upload_photo(student_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    # Plain def: FastAPI runs this in the threadpool so the file copy and the
+    # commit never block the event loop.
 
-    s = crud.get_student(db, student_id)
-    if not s:
+    if crud.get_student_photo_meta(db, student_id) is None:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    contents = await file.read()
-    crud.set_student_photo(db, student_id, contents)
+    chunks = iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b"")
+    try:
+        photo_hash = photo_store.store.put_stream(chunks, max_bytes=photo_store.MAX_PHOTO_BYTES)
+    except photo_store.PhotoTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    crud.set_student_photo_hash(db, student_id, photo_hash)
+
+    return {"message": "Photo uploaded", "photo_url": models.photo_url(student_id, photo_hash)}
+
+
+# ---------------------- Photo Download -------------------------
+
+def _photo_media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
 
-    return {"message": "Photo uploaded"}
+
+def _parse_range(range_header: str, size: int):
+    """Single `bytes=start-end` range -> (start, end) inclusive, None if unsatisfiable."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if start == "":
+            # suffix range: last N bytes
+            length = int(end)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _load_photo(photo_hash: str, thumbnail: bool):
+    """(path, data) from the photo store; path is set for file backed stores."""
+    path = photo_store.store.path(photo_hash, thumbnail)
+    if path is not None:
+        return path, None
+    return None, photo_store.store.get(photo_hash, thumbnail)
+
+
+@app.get("/students/{student_id}/photo")
+def get_photo(
+    student_id: int,
+    request: Request,
+    size: str = Query("full", pattern="^(full|thumb)$"),
+    db: Session = Depends(get_db),
+):
+
+    meta = crud.get_student_photo_meta(db, student_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    photo_hash, updated_at = meta
+    thumbnail = size == "thumb"
+    path = data = None
+    if photo_hash:
+        path, data = _load_photo(photo_hash, thumbnail)
+        if path is None and data is None and thumbnail:
+            # no thumbnail could be generated, fall back to the original
+            thumbnail = False
+            path, data = _load_photo(photo_hash, False)
+
+    if path is None and data is None:
+        # photos uploaded before the photo store existed live in the BLOB column
+        thumbnail = False
+        data = crud.get_student_photo(db, student_id)
+        if not data:
+            raise HTTPException(status_code=404, detail="Photo not found")
+        photo_hash = photo_hash or hashlib.sha256(data).hexdigest()
+
+    etag = f'"{photo_hash}-thumb"' if thumbnail else f'"{photo_hash}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    # versioned URLs never change content
+    if request.query_params.get("v") == photo_hash:
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    if _not_modified(request, etag, updated_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if path is not None:
+        total_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            media_type = _photo_media_type(f.read(12))
+    else:
+        total_size = len(data)
+        media_type = _photo_media_type(data)
+
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, total_size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{total_size}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        start, end = byte_range
+        if path is not None:
+            with open(path, "rb") as f:
+                f.seek(start)
+                chunk = f.read(end - start + 1)
+        else:
+            chunk = data[start:end + 1]
+        headers["Content-Range"] = f"bytes {start}-{end}/{total_size}"
+        return Response(chunk, status_code=status.HTTP_206_PARTIAL_CONTENT,
+                        media_type=media_type, headers=headers)
+
+    if path is not None:
+        # lets the server use sendfile for the body
+        return FileResponse(path, media_type=media_type, headers=headers)
+    return Response(data, media_type=media_type, headers=headers)
 
 
 # ---------------------- Prediction -------------------------
 
+async def _model_grade(math: float, science: float, english: float, attendance, avg: float):
+    """(grade, model_version): the active trained model if any, else the threshold ladder."""
+    if model_registry.registry.predictor is None:
+        return predict_grade(avg), None
+    try:
+        features = [math, science, english, ml_model.safe_float(attendance)]
+        return await model_registry.registry.predict_one(features), model_registry.registry.predictor.version
+    except model_registry.ModelNotAvailable:
+        return predict_grade(avg), None
+
+
 @app.post("/predict-grade")
-def predict(payload: dict):
+async def predict(payload: dict):
 
     math = float(payload.get("math", 0))
     science = float(payload.get("science", 0))
@@ -110,23 +788,139 @@ def predict(payload: dict):
 
     if "marks" in payload and (math == 0 and science == 0 and english == 0):
         avg = float(payload.get("marks", 0))
-        grade = predict_grade(avg)
+        grade, version = await _model_grade(avg, avg, avg, payload.get("attendance", 100), avg)
         insights = ai_insights(avg, avg, avg, payload.get("attendance", 100))
-        return {"average": avg, "predicted_grade": grade, "insights": insights}
+        return {"average": avg, "predicted_grade": grade, "insights": insights, "model_version": version}
 
     avg = (math + science + english) / 3.0
-    grade = predict_grade(avg)
+    grade, version = await _model_grade(math, science, english, payload.get("attendance", 100), avg)
     insights = ai_insights(math, science, english, payload.get("attendance", 100))
 
-    return {"average": avg, "predicted_grade": grade, "insights": insights}
+    return {"average": avg, "predicted_grade": grade, "insights": insights, "model_version": version}
 
 
-# ---------------------- Analytics -------------------------
+PREDICT_BATCH_MAX = int(os.getenv("PREDICT_BATCH_MAX", "100000"))
 
-@app.get("/top-students")
-def top_students(limit: int = 5, db: Session = Depends(get_db)):
 
-    students = crud.top_students(db, limit)
+def _score_column(records, key: str, default: float):
+    values = [r.get(key, default) for r in records]
+    try:
+        column = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        column = np.array([ml_model.safe_float(v) for v in values])
+    # None/missing values count as 0, like safe_float
+    return np.nan_to_num(column, nan=0.0)
+
+
+def _predict_records(records) -> List[dict]:
+    math = _score_column(records, "math", 0)
+    science = _score_column(records, "science", 0)
+    english = _score_column(records, "english", 0)
+    attendance = _score_column(records, "attendance", 100)
+
+    # same fallback as /predict-grade: a single "marks" value when no subject marks are given
+    marks = _score_column(records, "marks", 0)
+    use_marks = (math == 0) & (science == 0) & (english == 0) & np.array(["marks" in r for r in records], dtype=bool)
+    math, science, english = (np.where(use_marks, marks, col) for col in (math, science, english))
+
+    predicted = ml_model.predict_batch(math, science, english, attendance)
+    predictor = model_registry.registry.predictor
+    if predictor is not None:
+        predicted["grade"] = predictor.predict(np.column_stack([math, science, english, attendance]))
+    results = []
+    for record, average, grade, mask in zip(
+        records, predicted["average"].tolist(), predicted["grade"].tolist(), predicted["mask"].tolist()
+    ):
+        result = {
+            "average": average,
+            "predicted_grade": grade,
+            "weak_subjects": ml_model.WEAK_SUBJECTS_BY_MASK[mask],
+            "suggestions": ml_model.SUGGESTIONS_BY_MASK[mask],
+        }
+        if "id" in record:
+            result["id"] = record["id"]
+        results.append(result)
+    return results
+
+
+@app.post("/predict-grade/batch")
+async def predict_batch(request: Request):
+    """
+    Predict grades for a JSON array, NDJSON or CSV body of score records
+    ({id?, math, science, english, attendance?, marks?}). Records that can't
+    be parsed are reported by row number (1-based).
+    """
+    records = []
+    errors = []
+    row = 0
+    async for obj, error in _iter_import_rows(request):
+        row += 1
+        if error is None and not isinstance(obj, dict):
+            error = "Expected an object"
+        if error is not None:
+            errors.append({"row": row, "error": error})
+            continue
+        records.append(obj)
+        if len(records) > PREDICT_BATCH_MAX:
+            raise HTTPException(status_code=413, detail=f"At most {PREDICT_BATCH_MAX} records per batch")
+
+    results = await run_in_threadpool(_predict_records, records) if records else []
+    predictor = model_registry.registry.predictor
+    body = serialization.dumps({
+        "model_version": predictor.version if predictor else None,
+        "count": len(results),
+        "results": results,
+        "errors": errors,
+        "suggestion_texts": ml_model.SUGGESTIONS,
+    })
+    return Response(body, media_type="application/json")
+
+
+# ---------------------- Admin auth -------------------------
+# Endpoints that change what the server runs; all refused unless ADMIN_TOKEN is set
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(request: Request) -> None:
+    auth = request.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# ---------------------- Model -------------------------
+
+@app.get("/model/info")
+def model_info():
+    """Active model metadata, inference latency and the versions on disk."""
+    return model_registry.registry.info()
+
+
+@app.post("/model/train", dependencies=[Depends(require_admin)])
+def train_model(db: Session = Depends(get_db)):
+    """Train on the current students, save a new version and serve it."""
+    try:
+        return model_registry.registry.train(db)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Training requires scikit-learn")
+
+
+@app.post("/model/activate/{version}", dependencies=[Depends(require_admin)])
+def activate_model(version: str):
+    try:
+        return model_registry.registry.activate(version).meta
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+
+
+# ---------------------- Analytics -------------------------
+# Leaderboards and course stats are served from the response cache; crud
+# invalidates the matching tags on every write.
+
+def _leaderboard_entries(students):
     return [
         {
             "id": s.id,
@@ -139,9 +933,165 @@ def top_students(limit: int = 5, db: Session = Depends(get_db)):
     ]
 
 
+@app.get("/top-students")
+async def top_students(request: Request, limit: int = 5, db: AsyncSession = Depends(get_async_db)):
+    version = await crud_async.table_version(db)
+    etag = _etag("top", version, limit)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+    key, tags = f"top::{limit}:{version}", [top_tag()]
+    body = await response_cache.aget(key, tags)
+    if body is None:
+        body = serialization.dumps(_leaderboard_entries(await crud_async.top_students(db, limit)))
+        await response_cache.aset(key, body, tags)
+    return _json_bytes(body, etag)
+
+
+@app.get("/courses/{course}/top-students")
+async def course_top_students(course: str, request: Request, limit: int = 5, db: AsyncSession = Depends(get_async_db)):
+    version = await crud_async.table_version(db)
+    etag = _etag("top", version, limit, course)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+    key, tags = f"top:{course}:{limit}:{version}", [top_tag(), top_tag(course)]
+    body = await response_cache.aget(key, tags)
+    if body is None:
+        body = serialization.dumps(_leaderboard_entries(await crud_async.top_students(db, limit, course=course)))
+        await response_cache.aset(key, body, tags)
+    return _json_bytes(body, etag)
+
+
+@app.get("/students/{student_id}/rank")
+async def student_rank(student_id: int, db: AsyncSession = Depends(get_async_db)):
+
+    rank = await crud_async.student_rank(db, student_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return rank
+
+
 @app.get("/course-stats")
-def course_stats(db: Session = Depends(get_db)):
-    return crud.course_stats(db)
+async def course_stats(request: Request, db: AsyncSession = Depends(get_async_db)):
+    version = await crud_async.table_version(db)
+    etag = _etag("course-stats", version)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+    key = f"{COURSE_STATS_TAG}:{version}"
+    body = await response_cache.aget(key, [COURSE_STATS_TAG])
+    if body is None:
+        body = serialization.dumps(await crud_async.course_stats(db))
+        await response_cache.aset(key, body, [COURSE_STATS_TAG])
+    return _json_bytes(body, etag)
+
+
+# ---------------------- Insights -------------------------
+# Served from insights.engine's snapshot, rebuilt only when the students
+# change counter moves
+
+def _insights_response(request: Request, snapshot, body, *key) -> Response:
+    etag = _etag("insights", snapshot.version, *key)
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+    return _json_bytes(serialization.dumps(body), etag)
+
+
+@app.get("/insights")
+def cohort_insights(request: Request, db: Session = Depends(get_db)):
+    snapshot = insights.engine.snapshot(db)
+    return _insights_response(request, snapshot, snapshot.cohort_summary())
+
+
+@app.get("/students/{student_id}/insights")
+def student_insights(student_id: int, request: Request, db: Session = Depends(get_db)):
+    snapshot = insights.engine.snapshot(db)
+    body = snapshot.student(student_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return _insights_response(request, snapshot, body, "student", student_id)
+
+
+@app.get("/courses/{course}/insights")
+def course_insights(course: str, request: Request, db: Session = Depends(get_db)):
+    snapshot = insights.engine.snapshot(db)
+    body = snapshot.course(course)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return _insights_response(request, snapshot, body, "course", course)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
+
+
+# ---------------------- Admin: profiling -------------------------
+# Sampling profiler for this worker; disabled unless ADMIN_TOKEN is set
+
+def _profile_response(sampler: profiler.Sampler, fmt: str, route: Optional[str]) -> Response:
+    headers = {"X-Profile-Worker": str(os.getpid()), "Cache-Control": "no-store"}
+    if fmt == "pstats":
+        headers["Content-Disposition"] = 'attachment; filename="profile.pstats"'
+        return Response(sampler.pstats(route), media_type="application/octet-stream", headers=headers)
+    if fmt == "json":
+        return _json_bytes(serialization.dumps(sampler.summary()), None)
+    return Response(sampler.collapsed(route), media_type="text/plain", headers=headers)
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000),
+    format: str = Query("collapsed", pattern="^(collapsed|pstats|json)$"),
+    route: Optional[str] = Query(None, description='Only this route, e.g. "GET /students"'),
+):
+    """Sample every thread of this worker for `seconds` and return the stacks."""
+    try:
+        sampler = await profiler.profiler.capture(app, seconds, interval_ms / 1000)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _profile_response(sampler, format, route)
+
+
+@app.post("/admin/profile/requests", dependencies=[Depends(require_admin)])
+async def start_request_profiling(
+    percent: float = Query(5, gt=0, le=100),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000),
+):
+    """Keep sampling the stacks of `percent`% of requests until stopped."""
+    try:
+        profiler.profiler.start(app, "requests", interval_ms / 1000, percent)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Profiling started", "percent": percent, "interval_ms": interval_ms, "pid": os.getpid()}
+
+
+@app.get("/admin/profile/requests", dependencies=[Depends(require_admin)])
+def request_profile(
+    format: str = Query("collapsed", pattern="^(collapsed|pstats|json)$"),
+    route: Optional[str] = None,
+):
+    """Samples collected so far by the current (or last) request profile."""
+    sampler = profiler.profiler.sampler
+    if sampler is None or profiler.profiler.mode != "requests":
+        raise HTTPException(status_code=404, detail="No request profile on this worker")
+    return _profile_response(sampler, format, route)
+
+
+@app.delete("/admin/profile/requests", dependencies=[Depends(require_admin)])
+def stop_request_profiling():
+    if profiler.profiler.mode != "requests" or not profiler.profiler.active:
+        raise HTTPException(status_code=404, detail="No request profile running on this worker")
+    return profiler.profiler.stop().summary()
 
 
 # ---------------------- Run API -------------------------
@@ -0,0 +1,291 @@
+# metrics.py
+# Request, query and connection-pool metrics, exposed by GET /metrics in the
+# Prometheus text format. Everything is kept in process memory as plain
+# counters and fixed-bucket histograms, so recording is a dict lookup, a
+# bisect and a few additions under a lock.
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# requests that matched no route share one label, raw paths would explode the series count
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+# ---------------------- Metric types ----------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    """A Counter that can go down, or is read from `collect` when rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.collect is not None:
+            with self._lock:
+                self._values = dict(self.collect())
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            entry[i] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for labels, entry in items:
+            # stored per bucket, exposed cumulatively
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(entry[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request start to the last body byte sent.", ("method", "route")))
+RESPONSE_BYTES = registry.register(Histogram(
+    "http_response_size_bytes", "Response body size as sent (after compression).", ("method", "route"),
+    buckets=SIZE_BUCKETS))
+IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ("method",)))
+REQUEST_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed while handling a request.", ("method", "route"),
+    buckets=COUNT_BUCKETS))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    "http_request_db_seconds", "Time a request spent executing SQL statements.", ("method", "route")))
+QUERY_SECONDS = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time.", ("engine", "statement"), buckets=QUERY_BUCKETS))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a connection from the pool, including opening new ones.",
+    ("engine",), buckets=QUERY_BUCKETS))
+
+
+# ---------------------- SQLAlchemy hooks ----------------------
+
+# (queries, seconds) of the request being handled; the middleware sets it and
+# the engine hooks add to it. Context variables follow the request into the
+# threadpool and into SQLAlchemy's async greenlets.
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+_engines: Dict[str, Engine] = {}
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA") else "OTHER"
+
+
+def _time_checkouts(name: str, pool) -> None:
+    # pools have no "before checkout" event, so time the pool's own getter
+    get = pool._do_get
+
+    def timed_get():
+        started = time.perf_counter()
+        try:
+            return get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started, name)
+
+    pool._do_get = timed_get
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Time every statement and pool checkout on `engine` (the sync_engine of an AsyncEngine)."""
+    if name in _engines:
+        return
+    _engines[name] = engine
+    _time_checkouts(name, engine.pool)
+
+    @event.listens_for(engine, "engine_disposed")
+    def _disposed(engine):
+        # dispose() swaps in a fresh pool
+        _time_checkouts(name, engine.pool)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        QUERY_SECONDS.observe(elapsed, name, _statement_kind(statement))
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def _pool_sizes() -> Dict[Tuple, float]:
+    values = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        checked_out = getattr(pool, "checkedout", None)
+        if checked_out is not None:
+            values[(name, "checked_out")] = checked_out()
+        size = getattr(pool, "size", None)
+        if size is not None:
+            values[(name, "size")] = size()
+    return values
+
+
+registry.register(Gauge(
+    "db_pool_connections", "Pool size and connections checked out, per engine.", ("engine", "state"),
+    collect=_pool_sizes))
+
+
+# ---------------------- Middleware ----------------------
+
+class MetricsMiddleware:
+    """
+    Records count, latency, response size and SQL work per request, labelled
+    with the matched route template rather than the raw path.
+    """
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        size = 0
+        db_stats = [0, 0.0]
+        token = _request_db.set(db_stats)
+
+        async def measuring_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, measuring_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec(method)
+            _request_db.reset(token)
+            # the router leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            REQUESTS.inc(method, route, str(status))
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            RESPONSE_BYTES.observe(size, method, route)
+            REQUEST_QUERIES.observe(db_stats[0], method, route)
+            REQUEST_DB_SECONDS.observe(db_stats[1], method, route)
@@ -0,0 +1,190 @@
+# middleware.py
+import json
+import zlib
+
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies above `max_bytes` for POSTs to paths ending in
+    `path_suffix`. Requests announcing a larger Content-Length are refused
+    before any of the body is read; chunked bodies are cut off as soon as
+    the limit is crossed.
+    """
+
+    def __init__(self, app, max_bytes: int, path_suffix: str = "/photo"):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_suffix = path_suffix
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].endswith(self.path_suffix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        try:
+            content_length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            content_length = 0
+        if content_length > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # raised while the form is being parsed, FastAPI turns it into the 413 response
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {self.max_bytes} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+# Already compressed, or must reach the client unbuffered
+UNCOMPRESSED_TYPES = ("image/", "text/event-stream", "application/vnd.apache.parquet", "application/octet-stream")
+
+
+def _accepted_encodings(header: str) -> dict:
+    """Accept-Encoding -> {coding: q}."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            # wbits 16+ gives a gzip container
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+
+class CompressionMiddleware:
+    """
+    Brotli/gzip response compression negotiated from Accept-Encoding, for
+    bodies of at least `minimum_size` bytes. Streaming responses are
+    compressed chunk by chunk. Strong ETags become weak ones, since the
+    encoded bytes differ from the identity representation.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    def _choose(self, scope) -> str:
+        accepted = _accepted_encodings(dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1"))
+        candidates = (["br"] if brotli is not None else []) + ["gzip"]
+        best = max(candidates, key=lambda c: accepted.get(c, accepted.get("*", 0.0)))
+        return best if accepted.get(best, accepted.get("*", 0.0)) > 0 else ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._choose(scope)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or start["status"] in (204, 206, 304)
+                    or content_type.startswith(UNCOMPRESSED_TYPES)
+                )
+                if passthrough:
+                    await send(start)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.levels[encoding])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start)
+                else:
+                    data = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,88 @@
+# migrations.py
+# Schema upgrades for databases created by an older version of the app.
+# create_all only creates tables that don't exist yet, it never alters an
+# existing one, so columns and indexes added to an existing table are listed
+# here and added with ALTER TABLE ... ADD COLUMN / CREATE INDEX. Every step checks the live schema
+# first: upgrade() runs on every startup and does nothing on a current
+# database. `python migrations.py` upgrades the database at DATABASE_URL.
+from typing import List, NamedTuple, Optional, Union
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+import models
+
+
+class AddColumn(NamedTuple):
+    table: str
+    column: str
+    # SQL run once right after the column is added, to fill existing rows
+    backfill: Optional[str] = None
+
+
+class AddIndex(NamedTuple):
+    table: str
+    index: str
+
+
+# in the order they were introduced
+STEPS: List[Union[AddColumn, AddIndex]] = [
+    # photos served from the content-addressed store
+    # leaderboard ORDER BY total, overall and per course
+    AddIndex("student", "ix_student_total"),
+    AddIndex("student", "ix_student_course_total"),
+    AddColumn("student", "photo_hash"),
+    AddColumn("student", "photo_updated_at"),
+    # optimistic locking; the server default fills existing rows, the
+    # backfill covers backends that leave them NULL
+    AddColumn("student", "version", "UPDATE student SET version = 1 WHERE version IS NULL"),
+    # left NULL on existing rows, nothing is known about when they last changed
+    AddColumn("student", "updated_at"),
+]
+
+
+def _column_ddl(engine: Engine, table: str, name: str) -> str:
+    column = models.db.metadata.tables[table].c[name]
+    ddl = f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+    if column.server_default is not None:
+        # SQLite and PostgreSQL fill existing rows with the default
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        if column.server_default is None:
+            raise ValueError(f"{table}.{name} is NOT NULL without a server default, it can't be added in place")
+        ddl += " NOT NULL"
+    return ddl
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Apply the missing steps; returns what was added, as "table.column" or "table.index"."""
+    applied = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        tables = {s.table for s in STEPS} & set(inspector.get_table_names())
+        existing = {
+            t: {c["name"] for c in inspector.get_columns(t)} | {i["name"] for i in inspector.get_indexes(t)}
+            for t in tables
+        }
+        for step in STEPS:
+            name = step.column if isinstance(step, AddColumn) else step.index
+            # a table create_all just made already has everything
+            if step.table not in existing or name in existing[step.table]:
+                continue
+            if isinstance(step, AddColumn):
+                conn.execute(text(f"ALTER TABLE {step.table} ADD COLUMN {_column_ddl(engine, step.table, name)}"))
+                if step.backfill:
+                    conn.execute(text(step.backfill))
+            else:
+                next(i for i in models.db.metadata.tables[step.table].indexes if i.name == name).create(conn)
+            existing[step.table].add(name)
+            applied.append(f"{step.table}.{name}")
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    models.db.metadata.create_all(bind=engine)
+    added = upgrade(engine)
+    print(f"Added {', '.join(added)}" if added else "Schema is up to date")
@@ -1,5 +1,7 @@
 from typing import Dict, List
+import numpy as np
 from database import Base
+from models import GRADE_CUTOFFS, GRADES
 
 def predict_grade(avg: float) -> str:
     if avg >= 90:
@@ -67,3 +69,50 @@ def ai_insights(math: float, science: float, english: float, attendance: float)
         "weak_subjects": weak_subjects,
         "suggestions": suggestions
     }
+
+
+# ---------------------- Batch prediction ----------------------
+# Same rules as predict_grade/ai_insights, evaluated on whole columns.
+# Suggestions are returned as codes, SUGGESTIONS maps them to the text.
+
+SUBJECTS = ["Math", "Science", "English"]
+LOW_ATTENDANCE = 75
+SUGGESTIONS = {
+    "math_practice": "Practice topic-wise Math problems and revise formulas.",
+    "science_revision": "Revise Science fundamentals and perform simple experiments.",
+    "english_practice": "Improve vocabulary and practice comprehension passages.",
+    "attendance": "Attend classes regularly to improve learning consistency.",
+    "keep_going": "Great performance! Continue with regular revision and mock tests.",
+}
+_SUBJECT_CODES = ["math_practice", "science_revision", "english_practice"]
+_GRADE_LABELS = np.array(GRADES)
+
+
+def _mask_tables():
+    """weak_subjects and suggestion codes for each 4-bit mask (3 weak-subject bits + low attendance)."""
+    weak_subjects, suggestions = [], []
+    for mask in range(16):
+        weak = [SUBJECTS[i] for i in range(3) if mask >> i & 1]
+        codes = [_SUBJECT_CODES[i] for i in range(3) if mask >> i & 1]
+        if mask & 8:
+            codes.append("attendance")
+        weak_subjects.append(weak)
+        suggestions.append(codes or ["keep_going"])
+    return weak_subjects, suggestions
+
+
+WEAK_SUBJECTS_BY_MASK, SUGGESTIONS_BY_MASK = _mask_tables()
+
+
+def predict_batch(math, science, english, attendance) -> Dict[str, np.ndarray]:
+    """
+    Averages, grades and insight masks for arrays of scores. `mask` indexes
+    WEAK_SUBJECTS_BY_MASK / SUGGESTIONS_BY_MASK.
+    """
+    scores = np.column_stack([math, science, english]).astype(float)
+    average = scores.mean(axis=1)
+    grade = _GRADE_LABELS[np.searchsorted(GRADE_CUTOFFS, average, side="right")]
+    # ai_insights compares subjects against the average rounded to 2 places
+    weak = scores < np.round(average, 2)[:, None]
+    mask = weak @ np.array([1, 2, 4]) + (np.asarray(attendance, dtype=float) < LOW_ATTENDANCE) * 8
+    return {"average": average, "grade": grade, "mask": mask}
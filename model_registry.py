@@ -0,0 +1,322 @@
+# model_registry.py
+# Trained grade model: versioned artifacts on disk, one active model held in
+# memory, and a micro-batcher that groups concurrent /predict-grade calls
+# into a single predict() over a feature matrix.
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+MODEL_DIR = os.getenv("MODEL_DIR", "./model_artifacts")
+FEATURES = ["math", "science", "english", "attendance"]
+# below this many labelled rows a model isn't worth training
+MIN_TRAINING_ROWS = int(os.getenv("MODEL_MIN_TRAINING_ROWS", "50"))
+
+# micro-batching: wait at most this long for more requests to join a batch
+BATCH_MAX_SIZE = int(os.getenv("MODEL_BATCH_MAX_SIZE", "256"))
+BATCH_MAX_WAIT_MS = float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", "2"))
+
+
+class ModelNotAvailable(Exception):
+    pass
+
+
+# ---------------------- Training ----------------------
+
+def training_data(db: Session):
+    """(X, y) from the students table: FEATURES columns, grade labels."""
+    S = models.Student
+    rows = db.execute(
+        select(*[getattr(S, f) for f in FEATURES], S.grade).where(S.grade.is_not(None))
+    ).all()
+    X = np.array([row[:-1] for row in rows], dtype=float).reshape(-1, len(FEATURES))
+    y = np.array([row[-1] for row in rows])
+    return np.nan_to_num(X, nan=0.0), y
+
+
+def train(db: Session, model_dir: str = MODEL_DIR, activate: bool = True) -> Dict:
+    """Fit a new model on the current students, save it as a new version and return its metadata."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X, y = training_data(db)
+    if len(y) < MIN_TRAINING_ROWS or len(set(y)) < 2:
+        raise ValueError(f"Need at least {MIN_TRAINING_ROWS} students across 2+ grades to train, have {len(y)}")
+
+    pipeline = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+    stratify = y if min(np.unique(y, return_counts=True)[1]) >= 2 else None
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=0, stratify=stratify)
+    started = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    accuracy = float(pipeline.score(X_test, y_test))
+    # the served model sees every row
+    pipeline.fit(X, y)
+
+    meta = {
+        "version": _new_version(model_dir),
+        "trained_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "algorithm": "StandardScaler+LogisticRegression",
+        "features": FEATURES,
+        "classes": [str(c) for c in pipeline.classes_],
+        "training_rows": int(len(y)),
+        "holdout_accuracy": round(accuracy, 4),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+    save(pipeline, meta, model_dir)
+    if activate:
+        set_active(meta["version"], model_dir)
+    return meta
+
+
+def _new_version(model_dir: str) -> str:
+    base = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    version, n = base, 1
+    while os.path.exists(os.path.join(model_dir, version)):
+        n += 1
+        version = f"{base}-{n}"
+    return version
+
+
+# ---------------------- Artifacts ----------------------
+# MODEL_DIR/<version>/{model.joblib, meta.json}, MODEL_DIR/ACTIVE names the served version
+
+def save(model, meta: Dict, model_dir: str = MODEL_DIR) -> str:
+    import joblib
+
+    os.makedirs(model_dir, exist_ok=True)
+    # build the version directory aside and rename it in, so readers never see half an artifact
+    tmp = tempfile.mkdtemp(dir=model_dir, prefix=".tmp-")
+    try:
+        joblib.dump(model, os.path.join(tmp, "model.joblib"))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        path = os.path.join(model_dir, meta["version"])
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+def list_versions(model_dir: str = MODEL_DIR) -> List[str]:
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(model_dir)
+        if os.path.isfile(os.path.join(model_dir, name, "meta.json"))
+    )
+
+
+def check_version(version: str, model_dir: str = MODEL_DIR) -> None:
+    """ValueError unless `version` names an artifact directly inside model_dir."""
+    # a bare name only, so a version can't point load() at a pickle elsewhere
+    if not version or version.startswith(".") or ".." in version or any(sep in version for sep in ("/", "\\")):
+        raise ValueError(f"Invalid model version: {version!r}")
+    if version not in list_versions(model_dir):
+        raise ValueError(f"Unknown model version: {version}")
+
+
+def set_active(version: str, model_dir: str = MODEL_DIR) -> None:
+    check_version(version, model_dir)
+    tmp = os.path.join(model_dir, ".ACTIVE.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(model_dir, "ACTIVE"))
+
+
+def active_version(model_dir: str = MODEL_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(model_dir, "ACTIVE")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# ---------------------- Serving ----------------------
+
+class Predictor:
+    """An artifact loaded into memory, with latency counters for predict()."""
+
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, model, meta: Dict):
+        self.model = model
+        self.meta = meta
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)  # (seconds, batch size)
+        self.calls = 0
+        self.rows = 0
+
+    @classmethod
+    def load(cls, version: str, model_dir: str = MODEL_DIR) -> "Predictor":
+        import joblib
+
+        # joblib.load unpickles, only ever open artifacts this registry saved
+        check_version(version, model_dir)
+        path = os.path.join(model_dir, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(joblib.load(os.path.join(path, "model.joblib")), meta)
+
+    @property
+    def version(self) -> str:
+        return self.meta["version"]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        labels = self.model.predict(X)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append((elapsed, len(X)))
+            self.calls += 1
+            self.rows += len(X)
+        return labels
+
+    def latency(self) -> Dict:
+        with self._lock:
+            samples = list(self._latencies)
+        if not samples:
+            return {"calls": self.calls, "rows": self.rows}
+        per_call = np.array([s for s, _ in samples]) * 1000
+        return {
+            "calls": self.calls,
+            "rows": self.rows,
+            "window": len(samples),
+            "mean_batch_size": round(sum(n for _, n in samples) / len(samples), 2),
+            "p50_ms": round(float(np.percentile(per_call, 50)), 3),
+            "p95_ms": round(float(np.percentile(per_call, 95)), 3),
+            "p99_ms": round(float(np.percentile(per_call, 99)), 3),
+            "per_row_us": round(sum(s for s, _ in samples) / sum(n for _, n in samples) * 1e6, 3),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects single-row predictions from concurrent requests and runs them
+    as one predict() call: a batch is flushed when it reaches max_size or
+    max_wait_ms after its first request arrived.
+    """
+
+    def __init__(self, max_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(self, predictor: Predictor, features: List[float]):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((predictor, features, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch) -> None:
+        # requests queued across a model swap are grouped per predictor
+        by_predictor: Dict[int, list] = {}
+        for item in batch:
+            by_predictor.setdefault(id(item[0]), []).append(item)
+        for items in by_predictor.values():
+            predictor = items[0][0]
+            X = np.array([features for _, features, _ in items], dtype=float)
+            try:
+                labels = await asyncio.to_thread(predictor.predict, X)
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), label in zip(items, labels.tolist()):
+                if not future.done():
+                    future.set_result(label)
+
+
+class ModelRegistry:
+    """Holds the active Predictor; swapping it is a single reference assignment."""
+
+    def __init__(self, model_dir: str = MODEL_DIR):
+        self.model_dir = model_dir
+        self.predictor: Optional[Predictor] = None
+        self.batcher = MicroBatcher()
+
+    def load_active(self) -> Optional[Predictor]:
+        version = active_version(self.model_dir)
+        self.predictor = Predictor.load(version, self.model_dir) if version else None
+        return self.predictor
+
+    def activate(self, version: str) -> Predictor:
+        predictor = Predictor.load(version, self.model_dir)
+        set_active(version, self.model_dir)
+        self.predictor = predictor
+        return predictor
+
+    def train(self, db: Session) -> Dict:
+        meta = train(db, self.model_dir, activate=False)
+        self.activate(meta["version"])
+        return meta
+
+    async def predict_one(self, features: List[float]):
+        predictor = self.predictor
+        if predictor is None:
+            raise ModelNotAvailable("No trained model is active")
+        return await self.batcher.predict(predictor, features)
+
+    def info(self) -> Dict:
+        predictor = self.predictor
+        return {
+            "active": predictor.meta if predictor else None,
+            "latency": predictor.latency() if predictor else None,
+            "versions": list_versions(self.model_dir),
+            "batching": {"max_size": self.batcher.max_size, "max_wait_ms": self.batcher.max_wait * 1000},
+        }
+
+
+registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # python model_registry.py  -> train on the configured DB and activate the result
+    from database import SessionLocal
+
+    with SessionLocal() as session:
+        print(json.dumps(train(session), indent=2))
@@ -2,13 +2,44 @@ from sqlalchemy import Column, Integer, String, Float, LargeBinary, DateTime
 from datetime import datetime
 import base64
 from database import Base
+from bisect import bisect_right
 # models.py
 # models.py
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()  # Initialize Flask-SQLAlchemy
 
+
+# Lower bounds of the average for each grade above F
+GRADE_CUTOFFS = [50, 60, 70, 80, 90]
+GRADES = ["F", "C", "B", "B+", "A", "A+"]
+
+
+def compute_totals_and_grades(rows):
+    """
+    Batch version of Student.compute_total_and_grade for plain dicts
+    (used for bulk inserts). Fills "total" and "grade" in place.
+    """
+    for row in rows:
+        total = (row.get("math") or 0) + (row.get("science") or 0) + (row.get("english") or 0)
+        row["total"] = total
+        row["grade"] = GRADES[bisect_right(GRADE_CUTOFFS, total / 3)]
+    return rows
+
+
+def photo_url(student_id, photo_hash):
+    if not photo_hash:
+        return None
+    return f"/students/{student_id}/photo?v={photo_hash}"
+
+
 class Student(db.Model):
+    __table_args__ = (
+        # leaderboard queries: ORDER BY total, and per course ORDER BY total
+        db.Index("ix_student_total", "total"),
+        db.Index("ix_student_course_total", "course", "total"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -21,7 +52,13 @@ class Student(db.Model):
     total = db.Column(db.Float, default=0.0)
     grade = db.Column(db.String(2), nullable=True)
     attendance = db.Column(db.Float, default=100.0)
-    photo = db.Column(db.LargeBinary, nullable=True)
+    # Deferred so list/detail queries never pull the BLOB; served by GET /students/{id}/photo
+    photo = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    photo_hash = db.Column(db.String(64), nullable=True)
+    photo_updated_at = db.Column(db.DateTime, nullable=True)
+    # Bumped on every change to the row, GET /students/{id} derives its ETag from it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def compute_total_and_grade(self):
         self.total = (self.math or 0) + (self.science or 0) + (self.english or 0)
@@ -41,6 +78,11 @@ class Student(db.Model):
         return self.total, self.grade
 
 
+    @property
+    def photo_url(self):
+        """Versioned URL of the photo endpoint, None if no photo was uploaded."""
+        return photo_url(self.id, self.photo_hash)
+
     # ----------------------------------------------------------------------
     # Convert photo to Base64 safely
     # ----------------------------------------------------------------------
@@ -58,3 +100,46 @@ class Student(db.Model):
                 return ""
         except Exception:
             return ""
+
+
+class CourseStat(db.Model):
+    """
+    Running per-course aggregates kept up to date by the crud write functions
+    when MATERIALIZED_COURSE_STATS is enabled.
+    """
+    __tablename__ = "course_stats"
+
+    course = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum_total = db.Column(db.Float, nullable=False, default=0.0)
+    min_total = db.Column(db.Float, nullable=True)
+    max_total = db.Column(db.Float, nullable=True)
+    sum_math = db.Column(db.Float, nullable=False, default=0.0)
+    sum_science = db.Column(db.Float, nullable=False, default=0.0)
+    sum_english = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class TableVersion(db.Model):
+    """
+    Change counter per table, incremented in the same transaction as every
+    write. List and aggregate endpoints derive their ETags from it.
+    """
+    __tablename__ = "table_versions"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StudentChange(db.Model):
+    """
+    Append-only log of student writes, one row per student touched. The id
+    is the change feed cursor served by GET /students/changes.
+    """
+    __tablename__ = "student_changes"
+    # never reuse ids, cursors must only move forward
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, nullable=False, index=True)
+    op = db.Column(db.String(6), nullable=False)  # insert / update / delete
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,159 @@
+# photo_store.py
+import hashlib
+import io
+import os
+import tempfile
+from typing import Iterable, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+PHOTO_STORE_DIR = os.getenv("PHOTO_STORE_DIR", "./photos")
+THUMBNAIL_SIZE = int(os.getenv("PHOTO_THUMBNAIL_SIZE", "128"))
+MAX_PHOTO_BYTES = int(os.getenv("MAX_PHOTO_BYTES", str(5 * 1024 * 1024)))
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+class PhotoStore:
+    """
+    Content-addressed photo storage. Photos are keyed by the sha256 of their
+    bytes so identical uploads are stored once.
+    """
+
+    def put(self, data: bytes) -> str:
+        """Store `data` (and its thumbnail) and return its sha256 hex digest."""
+        raise NotImplementedError
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: int = MAX_PHOTO_BYTES) -> str:
+        """
+        Store a photo given as an iterable of chunks. Raises PhotoTooLarge as
+        soon as more than `max_bytes` have been read.
+        """
+        buf = bytearray()
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) > max_bytes:
+                raise PhotoTooLarge(f"Photo exceeds {max_bytes} bytes")
+        return self.put(bytes(buf))
+
+    def get(self, photo_hash: str, thumbnail: bool = False) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def path(self, photo_hash: str, thumbnail: bool = False) -> Optional[str]:
+        """Local file path for zero-copy serving, None if not stored on disk."""
+        return None
+
+    def delete(self, photo_hash: str) -> None:
+        raise NotImplementedError
+
+
+def make_thumbnail(source, size: int = THUMBNAIL_SIZE) -> Optional[bytes]:
+    """
+    Downscaled copy of the image given as bytes or a file path.
+    None if Pillow is missing or it isn't an image.
+    """
+    if Image is None:
+        return None
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        img.thumbnail((size, size))
+        out = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(out, format="PNG", optimize=True)
+        else:
+            img.convert("RGB").save(out, format="JPEG", quality=85)
+        return out.getvalue()
+    except Exception:
+        return None
+
+
+class LocalPhotoStore(PhotoStore):
+    """Stores photos as <root>/<aa>/<hash> and thumbnails under <root>/thumbs."""
+
+    def __init__(self, root: str = PHOTO_STORE_DIR):
+        self.root = root
+
+    def _file(self, photo_hash: str, thumbnail: bool = False) -> str:
+        base = os.path.join(self.root, "thumbs") if thumbnail else self.root
+        return os.path.join(base, photo_hash[:2], photo_hash)
+
+    def _write(self, target: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # write to a temp file and rename so readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put(self, data: bytes) -> str:
+        photo_hash = hashlib.sha256(data).hexdigest()
+        target = self._file(photo_hash)
+        if not os.path.exists(target):
+            self._write(target, data)
+            thumb = make_thumbnail(data)
+            if thumb is not None:
+                self._write(self._file(photo_hash, thumbnail=True), thumb)
+        return photo_hash
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: int = MAX_PHOTO_BYTES) -> str:
+        # hash while spooling to a temp file so the photo is never held in memory
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".upload")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise PhotoTooLarge(f"Photo exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            photo_hash = digest.hexdigest()
+            target = self._file(photo_hash)
+            if os.path.exists(target):
+                os.unlink(tmp)
+                return photo_hash
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        thumb = make_thumbnail(target)
+        if thumb is not None:
+            self._write(self._file(photo_hash, thumbnail=True), thumb)
+        return photo_hash
+
+    def get(self, photo_hash: str, thumbnail: bool = False) -> Optional[bytes]:
+        path = self.path(photo_hash, thumbnail)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def path(self, photo_hash: str, thumbnail: bool = False) -> Optional[str]:
+        path = self._file(photo_hash, thumbnail)
+        return path if os.path.exists(path) else None
+
+    def delete(self, photo_hash: str) -> None:
+        for thumbnail in (False, True):
+            try:
+                os.remove(self._file(photo_hash, thumbnail))
+            except FileNotFoundError:
+                pass
+
+
+# Backend used by the API, swap for another PhotoStore implementation if needed
+store: PhotoStore = LocalPhotoStore()
@@ -0,0 +1,307 @@
+# profiler.py
+# Sampling profiler for a live worker. A background thread snapshots every
+# thread's stack at a fixed interval (sys._current_frames), so nothing is
+# hooked into the code being measured and the cost is bounded by the
+# interval. Samples are tagged with the route being served, and come out as
+# collapsed stacks (flamegraph.pl / speedscope) or a pstats file.
+#
+# Each uvicorn worker profiles only itself.
+import asyncio
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MAX_STACK_DEPTH = 128
+
+UNTAGGED = "<other>"
+
+# leaf frames of threads waiting for work: the event loop's select and the
+# threadpool's queue get; sampling them would bury the busy stacks.
+# aiosqlite's thread shows the same Python leaf whether it waits or is inside
+# sqlite's C code, so it is skipped too: SQL time is on /metrics instead.
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("_base.py", "wait"),
+    ("core.py", "_connection_worker_thread"),
+}
+
+Frame = Tuple[str, int, str]  # (filename, first line, function), the pstats key
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame: Frame) -> str:
+    filename, line, name = frame
+    if line == 0:
+        return name
+    short = os.path.join(*filename.split(os.sep)[-2:]) if os.sep in filename else filename
+    return f"{name} ({short}:{line})"
+
+
+class Sampler:
+    """
+    Samples stacks until stopped. `keep(thread_id, route)` decides which
+    samples count; routes come from `route_of_code` for frames of endpoint
+    functions, or from `route_of_thread` (the event loop's current request).
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        route_of_code: Dict[object, str],
+        route_of_thread: Callable[[int], Optional[str]] = lambda thread_id: None,
+        keep: Callable[[int, Optional[str]], bool] = lambda thread_id, route: True,
+    ):
+        self.interval = interval
+        self.route_of_code = route_of_code
+        self.route_of_thread = route_of_thread
+        self.keep = keep
+        self.samples: Counter = Counter()  # (route, stack root-first) -> count
+        self.ticks = 0
+        self.started = time.monotonic()
+        self.stopped: Optional[float] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.stopped = self.stopped or time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._sample(thread_id, frame)
+
+    def _sample(self, thread_id: int, frame) -> None:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+            return
+        stack = []
+        route = None
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            if route is None:
+                route = self.route_of_code.get(code)
+            frame = frame.f_back
+        if route is None:
+            route = self.route_of_thread(thread_id)
+        if not self.keep(thread_id, route):
+            return
+        stack.reverse()
+        with self._lock:
+            self.samples[(route or UNTAGGED, tuple(stack))] += 1
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.samples)
+
+    # ---------------------- Output ----------------------
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Brendan Gregg's collapsed format, with the route as the root frame."""
+        lines = []
+        for (tag, stack), count in sorted(self.snapshot().items()):
+            if route is None or tag == route:
+                frames = [tag] + [_frame_label(f).replace(";", ",") for f in stack]
+                lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self, route: Optional[str] = None) -> bytes:
+        """
+        Marshalled stats in the format pstats.Stats / snakeviz load. Sample
+        counts stand in for call counts and each sample for `interval`
+        seconds; routes appear as root callers named after the route.
+        """
+        dt = self.interval
+        stats: Dict[Frame, list] = {}
+
+        def entry(frame):
+            if frame not in stats:
+                stats[frame] = [0, 0, 0.0, 0.0, {}]  # cc, nc, tt, ct, callers
+            return stats[frame]
+
+        for (tag, stack), count in self.snapshot().items():
+            if route is not None and tag != route:
+                continue
+            stack = ((f"<{tag}>", 0, tag),) + stack
+            seen = set()
+            for i, frame in enumerate(stack):
+                e = entry(frame)
+                if frame not in seen:
+                    # recursive frames count once toward inclusive time
+                    seen.add(frame)
+                    e[0] += count
+                    e[1] += count
+                    e[3] += count * dt
+                if i:
+                    caller = e[4].get(stack[i - 1], (0, 0, 0.0, 0.0))
+                    e[4][stack[i - 1]] = (caller[0] + count, caller[1] + count, caller[2], caller[3] + count * dt)
+            entry(stack[-1])[2] += count * dt
+        return marshal.dumps({k: (cc, nc, tt, ct, callers) for k, (cc, nc, tt, ct, callers) in stats.items()})
+
+    def summary(self, top: int = 20) -> Dict:
+        samples = self.snapshot()
+        by_route: Counter = Counter()
+        self_time: Dict[str, Counter] = {}
+        for (tag, stack), count in samples.items():
+            by_route[tag] += count
+            self_time.setdefault(tag, Counter())[_frame_label(stack[-1])] += count
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        return {
+            "pid": os.getpid(),
+            "interval_ms": self.interval * 1000,
+            "seconds": round(elapsed, 3),
+            "ticks": self.ticks,
+            "samples": sum(by_route.values()),
+            "routes": {
+                tag: {
+                    "samples": n,
+                    "seconds": round(n * self.interval, 3),
+                    "top_self": [{"frame": f, "samples": c} for f, c in self_time[tag].most_common(top)],
+                }
+                for tag, n in by_route.most_common()
+            },
+        }
+
+
+class Profiler:
+    """
+    One profiling session per worker: either a timed capture of everything,
+    or a standing sampler that only keeps stacks of a random `percent` of
+    requests. The middleware registers the selected requests' tasks.
+    """
+
+    def __init__(self):
+        self.sampler: Optional[Sampler] = None
+        self.mode: Optional[str] = None
+        self.percent = 0.0
+        self._route_of_code: Dict[object, str] = {}
+        # request task -> ASGI scope, for the requests being profiled
+        self._requests: "weakref.WeakKeyDictionary[asyncio.Task, dict]" = weakref.WeakKeyDictionary()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        return self.sampler is not None and self.sampler.running
+
+    def _map_routes(self, app) -> None:
+        self._route_of_code = {}
+        for route in app.routes:
+            endpoint = getattr(route, "endpoint", None)
+            code = getattr(endpoint, "__code__", None)
+            if code is not None:
+                self._route_of_code[code] = _route_tag(route)
+
+    def _request_route(self, thread_id: int) -> Optional[str]:
+        # what the event loop runs is the request whose task is current
+        if thread_id != self._loop_thread:
+            return None
+        task = asyncio.tasks._current_tasks.get(self._loop)
+        scope = self._requests.get(task) if task is not None else None
+        if scope is None:
+            return None
+        route = scope.get("route")
+        return _route_tag(route) if route is not None else f"{scope['method']} {UNTAGGED}"
+
+    def _keep_selected(self, thread_id: int, route: Optional[str]) -> bool:
+        if thread_id == self._loop_thread:
+            return route is not None and self._requests.get(
+                asyncio.tasks._current_tasks.get(self._loop)) is not None
+        # threadpool threads can't be tied to a request, keep the routes a selected request is on
+        return route is not None and route in {
+            _route_tag(s["route"]) for s in list(self._requests.values()) if "route" in s
+        }
+
+    def start(self, app, mode: str, interval: float, percent: float = 100.0) -> Sampler:
+        if self.active:
+            raise ProfilerBusy(f"A {self.mode} profile is already running")
+        self._map_routes(app)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._requests = weakref.WeakKeyDictionary()
+        self.mode = mode
+        self.percent = percent
+        keep = self._keep_selected if mode == "requests" else (lambda thread_id, route: True)
+        self.sampler = Sampler(interval, self._route_of_code, self._request_route, keep).start()
+        return self.sampler
+
+    def stop(self) -> Optional[Sampler]:
+        sampler = self.sampler
+        if sampler is not None:
+            sampler.stop()
+        return sampler
+
+    async def capture(self, app, seconds: float, interval: float) -> Sampler:
+        """Sample the whole worker for `seconds`."""
+        sampler = self.start(app, "timed", interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+        return sampler
+
+    def track(self, scope) -> Optional[asyncio.Task]:
+        """Called by the middleware at the start of a request; returns the task if it is being profiled."""
+        if not self.active:
+            return None
+        if self.mode == "requests" and random.random() * 100 >= self.percent:
+            return None
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+        return task
+
+    def untrack(self, task: asyncio.Task) -> None:
+        self._requests.pop(task, None)
+
+
+def _route_tag(route) -> str:
+    methods = ",".join(sorted(getattr(route, "methods", None) or ()))
+    return f"{methods} {route.path}".strip()
+
+
+class ProfilerMiddleware:
+    """Lets the profiler see which request the event loop is running."""
+
+    def __init__(self, app, profiler: "Profiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        task = self.profiler.track(scope) if scope["type"] == "http" and self.profiler.active else None
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if task is not None:
+                self.profiler.untrack(task)
+
+
+profiler = Profiler()
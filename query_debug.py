@@ -0,0 +1,213 @@
+# query_debug.py
+# Debug mode for SQL issued while handling a request (QUERY_DEBUG=1). Every
+# statement is recorded with its timing and the application line that issued
+# it. A request that goes over the query count or time budget is logged as a
+# warning, with repeated statements (the N+1 pattern) marked. Statements slower
+# than QUERY_DEBUG_SLOW_MS get their query plan logged once per statement.
+import logging
+import os
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import greenlet
+except ImportError:  # only needed to find call sites of async sessions
+    greenlet = None
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "0") == "1"
+# a request over either budget is logged as a warning
+QUERY_BUDGET_COUNT = int(os.getenv("QUERY_DEBUG_MAX_QUERIES", "10"))
+QUERY_BUDGET_MS = float(os.getenv("QUERY_DEBUG_MAX_DB_MS", "50"))
+SLOW_QUERY_MS = float(os.getenv("QUERY_DEBUG_SLOW_MS", "20"))
+# application frames shown per statement, innermost first
+CALL_SITE_DEPTH = int(os.getenv("QUERY_DEBUG_STACK_DEPTH", "2"))
+STATEMENT_LOG_CHARS = 300
+
+logger = logging.getLogger("query_debug")
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+# frames in these files are plumbing, the call site is whoever called into them
+_SKIP_FILES = {os.path.join(APP_ROOT, name) for name in ("query_debug.py", "metrics.py", "database.py")}
+
+
+class Query:
+    __slots__ = ("statement", "ms", "call_site", "executemany")
+
+    def __init__(self, statement: str, ms: float, call_site: str, executemany: bool):
+        self.statement = statement
+        self.ms = ms
+        self.call_site = call_site
+        self.executemany = executemany
+
+
+# statements of the request being handled, set by QueryDebugMiddleware
+_request_queries: ContextVar[Optional[List[Query]]] = ContextVar("request_queries", default=None)
+
+_explained: Set[str] = set()
+_engines: Dict[str, Engine] = {}
+
+
+# ---------------------- Call sites ----------------------
+
+def _is_app_frame(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(APP_ROOT) and filename not in _SKIP_FILES and "site-packages" not in filename
+
+
+def _frames():
+    frame = sys._getframe(2)
+    while frame is not None:
+        yield frame
+        frame = frame.f_back
+    # async sessions run the statement in a greenlet whose stack is all
+    # SQLAlchemy; the awaiting application code is on the parent's stack
+    if greenlet is not None:
+        parent = greenlet.getcurrent().parent
+        frame = parent.gr_frame if parent is not None else None
+        while frame is not None:
+            yield frame
+            frame = frame.f_back
+
+
+def call_site(depth: int = CALL_SITE_DEPTH) -> str:
+    sites = []
+    for frame in _frames():
+        if _is_app_frame(frame):
+            filename = os.path.relpath(frame.f_code.co_filename, APP_ROOT)
+            sites.append(f"{filename}:{frame.f_lineno} {frame.f_code.co_name}")
+            if len(sites) >= depth:
+                break
+    return " <- ".join(sites) or "?"
+
+
+# ---------------------- Query plans ----------------------
+
+def _explain(conn, statement: str, parameters) -> List[str]:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    # a fresh DBAPI cursor on the same connection, so the plan is read
+    # inside the same transaction without going back through these hooks
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" | ".join(str(col) for col in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _log_plan(conn, statement: str, parameters, ms: float, site: str) -> None:
+    if statement in _explained or not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+        return
+    _explained.add(statement)
+    try:
+        plan = _explain(conn, statement, parameters)
+    except Exception as e:
+        plan = [f"(plan unavailable: {e})"]
+    logger.warning(
+        "slow query %.2f ms at %s\n  %s\n  plan:\n    %s",
+        ms, site, _shorten(statement), "\n    ".join(plan),
+    )
+
+
+# ---------------------- Engine hooks ----------------------
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= STATEMENT_LOG_CHARS else statement[:STATEMENT_LOG_CHARS] + "..."
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Record statements run on `engine` (the sync_engine of an AsyncEngine) while a request is being debugged."""
+    if name in _engines:
+        return
+    _engines[name] = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("debug_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        ms = (time.perf_counter() - conn.info["debug_started"].pop()) * 1000
+        queries = _request_queries.get()
+        if queries is None:
+            return
+        site = call_site()
+        queries.append(Query(statement, ms, site, executemany))
+        if ms >= SLOW_QUERY_MS and not executemany:
+            _log_plan(conn, statement, parameters, ms, site)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("debug_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def report(method: str, path: str, queries: Sequence[Query], elapsed_ms: float) -> None:
+    """Log one request's statements; as a warning if it went over budget."""
+    total_ms = sum(q.ms for q in queries)
+    over = []
+    if len(queries) > QUERY_BUDGET_COUNT:
+        over.append(f"{len(queries)} queries > {QUERY_BUDGET_COUNT}")
+    if total_ms > QUERY_BUDGET_MS:
+        over.append(f"{total_ms:.1f} ms in SQL > {QUERY_BUDGET_MS:g} ms")
+
+    seen: Dict[str, int] = {}
+    for q in queries:
+        seen[q.statement] = seen.get(q.statement, 0) + 1
+    lines = [
+        f"{method} {path}: {len(queries)} queries, {total_ms:.2f} ms SQL of {elapsed_ms:.2f} ms"
+        + (f" -- OVER BUDGET ({'; '.join(over)})" if over else "")
+    ]
+    for q in queries:
+        repeated = f" [x{seen[q.statement]}]" if seen[q.statement] > 1 else ""
+        many = " (executemany)" if q.executemany else ""
+        lines.append(f"  {q.ms:8.2f} ms{repeated}{many} {_shorten(q.statement)}\n             at {q.call_site}")
+    logger.log(logging.WARNING if over else logging.INFO, "\n".join(lines))
+
+
+# ---------------------- Middleware ----------------------
+
+class QueryDebugMiddleware:
+    """
+    Collects the statements of each request and reports them when it ends.
+    Adds X-Query-Count and X-Query-Time-Ms response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        if not logger.handlers and not logging.getLogger().handlers:
+            # the per-request reports are INFO, make them visible without a logging config
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+            logger.addHandler(handler)
+        if logger.level == logging.NOTSET:
+            logger.setLevel(logging.INFO)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries: List[Query] = []
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+
+        async def send_with_counts(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(len(queries)).encode()))
+                headers.append((b"x-query-time-ms", f"{sum(q.ms for q in queries):.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            _request_queries.reset(token)
+            report(scope["method"], scope["path"], queries, (time.perf_counter() - started) * 1000)
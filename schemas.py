@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 # ---------------------- Base Schema ----------------------
 class StudentBase(BaseModel):
@@ -14,6 +14,12 @@ class StudentBase(BaseModel):
 class StudentCreate(StudentBase):
     pass
 
+# ---------------------- Bulk Import Schema ----------------------
+class StudentImport(StudentCreate):
+    # both NOT NULL in the student table, so a row without them can't be inserted
+    email: str  # also used to detect duplicates
+    age: int
+
 # ---------------------- Update Schema ----------------------
 class StudentUpdate(BaseModel):
     name: Optional[str] = None
@@ -23,12 +29,21 @@ class StudentUpdate(BaseModel):
     english: Optional[float] = None
     attendance: Optional[float] = None
 
+# ---------------------- Bulk Update/Delete Schemas ----------------------
+class StudentBulkUpdate(BaseModel):
+    ids: List[int]
+    changes: StudentUpdate  # applied to every student in ids
+
+class StudentBulkDelete(BaseModel):
+    ids: List[int]
+
 # ---------------------- Output Schema ----------------------
 class StudentOut(StudentBase):
     id: int
     total: float
     grade: str
-    photo: Optional[str] = None  # base64 image string
+    photo_url: Optional[str] = None   # GET endpoint serving the raw image
+    photo_hash: Optional[str] = None  # sha256 of the image, changes on re-upload
 
     # Pydantic v2: enable from_orm-style parsing
     model_config = {
@@ -1,51 +1,164 @@
 # seed_data.py
+"""
+Create a fresh database filled with students.
+
+    python seed_data.py                      # the 5 sample students
+    python seed_data.py --students 100000    # samples + synthetic students
+    python seed_data.py --students 1000000 --photos
+
+Synthetic rows are generated column-wise with NumPy (fixed seed, so the same
+arguments always give the same data) and inserted in chunks in one
+transaction. --photos stores a small pool of generated images in the photo
+store and assigns them round-robin.
+"""
+import argparse
+import io
 import os
-from database import engine
-import models
-from sqlalchemy.orm import Session
+import time
 from datetime import datetime
 
-# -------------------------------
-# Delete old DB (development only)
-# -------------------------------
-DB_FILE = "students.db"
-if os.path.exists(DB_FILE):
-    os.remove(DB_FILE)
-    print(f"Deleted old database {DB_FILE}")
+import numpy as np
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 
-# -------------------------------
-# Create tables
-# -------------------------------
-models.Base.metadata.create_all(bind=engine)
+import crud
+import migrations
+import models
 
-# -------------------------------
-# Sample data
-# -------------------------------
-samples = [
+COURSES = ["Physics", "Chemistry", "Maths", "Biology", "History", "Computer Science", "Economics", "English"]
+INSERT_CHUNK = 10_000
+PHOTO_POOL = 64
+
+SAMPLES = [
     {"name":"Alice", "email":"alice@example.com", "course":"Physics", "math":85, "science":90, "english":78, "attendance":95},
     {"name":"Bob", "email":"bob@example.com", "course":"Chemistry", "math":72, "science":65, "english":70, "attendance":88},
     {"name":"Carol", "email":"carol@example.com", "course":"Maths", "math":92, "science":88, "english":90, "attendance":98},
     {"name":"David", "email":"david@example.com", "course":"Physics", "math":60, "science":55, "english":58, "attendance":80},
     {"name":"Eve", "email":"eve@example.com", "course":"Chemistry", "math":78, "science":82, "english":75, "attendance":85},
 ]
+SAMPLE_AGES = [20, 21, 19, 22, 20]
+
+
+# -------------------------------
+# Delete old DB (development only)
+# -------------------------------
+def reset_database(engine: Engine) -> None:
+    db_file = engine.url.database
+    if engine.url.get_backend_name() == "sqlite" and db_file and os.path.exists(db_file):
+        engine.dispose()
+        # WAL mode keeps -wal/-shm files next to the database
+        for path in (db_file, db_file + "-wal", db_file + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Deleted old database {db_file}")
+    models.Base.metadata.create_all(bind=engine)
+    # the db.Model tables (student, course_stats, table_versions, student_changes)
+    models.db.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
 
 # -------------------------------
-# Insert data
+# Generated data
 # -------------------------------
-with Session(engine) as db:
-    for s in samples:
-        student = models.Student(
-            name=s["name"],
-            email=s["email"],
-            course=s["course"],
-            math=s["math"],
-            science=s["science"],
-            english=s["english"],
-            attendance=s["attendance"]
-        )
-        student.compute_total_and_grade()  # calculates total & grade
-        db.add(student)
-    db.commit()
-
-print("✅ Seed data created successfully.")
-print("Run `uvicorn main:app --reload` and visit /students")
+def generate_students(n: int, start: int = 0, seed: int = 0):
+    """
+    `n` synthetic student rows as insert-ready dicts (total and grade filled).
+    Rows are numbered from `start` so emails stay unique across calls.
+    """
+    rng = np.random.default_rng([seed, start])
+    ability = rng.normal(68, 12, n)
+    # subject scores share an ability term so totals spread like real cohorts
+    scores = np.clip(ability[:, None] + rng.normal(0, 8, (n, 3)), 0, 100).round(1)
+    attendance = np.clip(rng.normal(88, 8, n), 40, 100).round(1)
+    total = scores.sum(axis=1).round(1)
+    grade = np.array(models.GRADES)[np.searchsorted(models.GRADE_CUTOFFS, total / 3, side="right")]
+    course = np.array(COURSES)[rng.integers(0, len(COURSES), n)]
+    age = rng.integers(17, 26, n)
+
+    columns = zip(
+        range(start, start + n), course.tolist(), age.tolist(),
+        scores[:, 0].tolist(), scores[:, 1].tolist(), scores[:, 2].tolist(),
+        total.tolist(), grade.tolist(), attendance.tolist(),
+    )
+    return [
+        {
+            "name": f"Student {i}", "email": f"student{i}@example.com", "age": a, "course": c,
+            "math": m, "science": s, "english": e, "total": t, "grade": g, "attendance": att,
+        }
+        for i, c, a, m, s, e, t, g, att in columns
+    ]
+
+
+def generate_photos(count: int = PHOTO_POOL, seed: int = 0):
+    """Small distinct JPEGs (raw bytes if Pillow is missing) to put in the photo store."""
+    rng = np.random.default_rng(seed)
+    try:
+        from PIL import Image
+    except ImportError:
+        return [rng.bytes(16 * 1024) for _ in range(count)]
+    photos = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)
+        out = io.BytesIO()
+        Image.fromarray(pixels).save(out, format="JPEG", quality=80)
+        photos.append(out.getvalue())
+    return photos
+
+
+def _insert_rows(db: Session, table, rows) -> None:
+    """
+    executemany straight on the driver: at a million rows, Core's per-row
+    parameter processing costs more than the insert itself. Rows must carry
+    every column that has a Python-side default.
+    """
+    keys = list(rows[0])
+    compiled = table.insert().compile(dialect=db.bind.dialect, column_keys=keys)
+    params = [tuple(row[k] for k in compiled.positiontup) for row in rows] if compiled.positional else rows
+    db.connection().exec_driver_sql(str(compiled), params)
+
+
+def seed(engine: Engine, students: int = len(SAMPLES), photos: bool = False, random_seed: int = 0) -> None:
+    """Recreate the database with the samples plus synthetic students up to `students` rows."""
+    reset_database(engine)
+    samples = [dict(s, age=age) for s, age in zip(SAMPLES, SAMPLE_AGES)][:students]
+    # compute totals/grades for the whole batch and insert with one executemany
+    models.compute_totals_and_grades(samples)
+
+    photo_hashes = []
+    if photos:
+        import photo_store
+
+        photo_hashes = [photo_store.store.put(data) for data in generate_photos(seed=random_seed)]
+
+    table = models.Student.__table__
+    # the same timestamp on every generated row, converted for the driver once
+    to_db = table.c.updated_at.type.bind_processor(engine.dialect)
+    now = to_db(datetime.utcnow()) if to_db else datetime.utcnow()
+    with Session(engine) as db:
+        db.execute(table.insert(), samples)
+        for start in range(len(samples), students, INSERT_CHUNK):
+            rows = generate_students(min(INSERT_CHUNK, students - start), start, random_seed)
+            for i, row in enumerate(rows, start):
+                row["version"] = 1
+                row["updated_at"] = now
+                if photo_hashes:
+                    row["photo_hash"] = photo_hashes[i % len(photo_hashes)]
+                    row["photo_updated_at"] = now
+            _insert_rows(db, table, rows)
+        crud.bump_table_version(db)
+        db.commit()
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=len(SAMPLES))
+    parser.add_argument("--photos", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(engine, args.students, args.photos, args.seed)
+    print(f"✅ Seed data created successfully ({args.students} students in {time.perf_counter() - started:.1f}s).")
+    print("Run `uvicorn main:app --reload` and visit /students")
@@ -0,0 +1,95 @@
+# serialization.py
+# Direct JSON encoding for the hot read paths: rows are zipped into dicts and
+# encoded in one call, instead of a StudentOut validate/dump per row followed
+# by FastAPI's response_model validation and jsonable_encoder pass.
+import json
+from typing import Iterable, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # optional, the json fallback gives the same output shape
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, only offered when installed
+    msgpack = None
+
+import schemas
+
+JSON_MEDIA_TYPE = "application/json"
+# {"column": [values...], ...}, loads straight into pd.DataFrame(payload)
+TABLE_MEDIA_TYPE = "application/vnd.table+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+STUDENT_FIELDS: List[str] = list(schemas.StudentOut.model_fields)
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_dicts(columns: Sequence[str], rows: Iterable[Sequence]) -> List[dict]:
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def rows_to_json(columns: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """JSON array of objects from plain row tuples."""
+    return dumps(rows_to_dicts(columns, rows))
+
+
+def student_dict(s) -> dict:
+    """StudentOut-shaped dict straight from a Student (photo_url is a model property)."""
+    return {field: getattr(s, field) for field in STUDENT_FIELDS}
+
+
+def student_json(s) -> bytes:
+    return dumps(student_dict(s))
+
+
+# ---------------------- Content negotiation ----------------------
+
+def _offers() -> List[str]:
+    offers = [JSON_MEDIA_TYPE, TABLE_MEDIA_TYPE]
+    if msgpack is not None:
+        offers += [MSGPACK_MEDIA_TYPE, "application/x-msgpack"]
+    return offers
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Media type for a list response: the best Accept match, JSON by default."""
+    if not accept:
+        return JSON_MEDIA_TYPE
+    offers = _offers()
+    ranges = []
+    for i, part in enumerate(accept.split(",")):
+        media_range, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        ranges.append((-q, i, media_range.lower()))
+
+    # highest q first, earlier entries win ties; wildcards resolve to JSON
+    for neg_q, _, media_range in sorted(ranges):
+        if neg_q >= 0:
+            break
+        if media_range in offers:
+            return MSGPACK_MEDIA_TYPE if media_range == "application/x-msgpack" else media_range
+        if media_range in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode_records(records: List[dict], columns: Sequence[str], media_type: str) -> bytes:
+    """Encode a list of row dicts in a media type returned by negotiate."""
+    if media_type == TABLE_MEDIA_TYPE:
+        return dumps({column: [record[column] for record in records] for column in columns})
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(records)
+    return dumps(records)
@@ -2,7 +2,6 @@
 import streamlit as st
 import requests
 import pandas as pd
-import base64
 
 DEFAULT_API = "http://127.0.0.1:8000"
 st.set_page_config(layout="wide", page_title="Smart Student Management System")
@@ -58,12 +57,29 @@ menu = st.sidebar.radio(
 # --------------------------
 # Helper Function
 # --------------------------
+if "etag_cache" not in st.session_state:
+    st.session_state["etag_cache"] = {}
+
+
+def cached_get(url, headers):
+    """GET that revalidates with If-None-Match and reuses the stored response on 304."""
+    cache = st.session_state["etag_cache"]
+    cached = cache.get(url)
+    if cached is not None:
+        headers = {**headers, "If-None-Match": cached.headers["ETag"]}
+    r = requests.get(url, headers=headers, timeout=6)
+    if r.status_code == 304 and cached is not None:
+        return cached
+    if r.status_code == 200 and "ETag" in r.headers:
+        cache[url] = r
+    return r
+
 def api(path, method="GET", json=None, files=None):
     url = f"{st.session_state['API_URL']}{path}"
     headers = {"Authorization": f"Bearer {st.session_state['token']}"} if st.session_state.get("token") else {}
     try:
         if method == "GET":
-            return requests.get(url, headers=headers, timeout=6)
+            return cached_get(url, headers)
         if method == "POST":
             return requests.post(url, json=json, headers=headers, files=files, timeout=6)
         if method == "PUT":
@@ -74,22 +90,75 @@ def api(path, method="GET", json=None, files=None):
         st.error(f"API error: {e}")
         return None
 
+
+def load_students():
+    """
+    All students as {id: row}. The first call loads a snapshot; later reruns
+    only apply the deltas from /students/changes since the saved cursor.
+    """
+    sync = st.session_state.get("students_sync")
+    if sync is not None and sync["api"] == st.session_state["API_URL"]:
+        while True:
+            r = api(f"/students/changes?since={sync['cursor']}")
+            if r is not None and r.status_code == 410:
+                # cursor fell out of the change log, start over
+                break
+            if not r or r.status_code != 200:
+                return sync["rows"]
+            page = r.json()
+            for change in page["changes"]:
+                if change["op"] == "delete":
+                    sync["rows"].pop(change["id"], None)
+                else:
+                    sync["rows"][change["id"]] = change["student"]
+            sync["cursor"] = page["cursor"]
+            if not page["has_more"]:
+                return sync["rows"]
+
+    # cursor first, so anything written during the snapshot is replayed next time
+    r = api("/students/changes")
+    if not r or r.status_code != 200:
+        return None
+    sync = {"api": st.session_state["API_URL"], "cursor": r.json()["cursor"], "rows": {}}
+    page_cursor = None
+    while True:
+        r = api("/students?limit=1000" + (f"&cursor={page_cursor}" if page_cursor else ""))
+        if not r or r.status_code != 200:
+            return None
+        sync["rows"].update((row["id"], row) for row in r.json())
+        page_cursor = r.headers.get("X-Next-Cursor")
+        if not page_cursor:
+            break
+    st.session_state["students_sync"] = sync
+    return sync["rows"]
+
+
+def load_scores():
+    """Student score columns as a DataFrame, from the Arrow endpoint when pyarrow is available."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+    if pa is not None:
+        r = api("/analytics/students.arrow")
+        if r is not None and r.status_code == 200:
+            return pa.ipc.open_stream(r.content).read_pandas()
+
+    rows = load_students()
+    if rows is None:
+        return None
+    return pd.DataFrame(sorted(rows.values(), key=lambda row: row["id"]))
+
 # --------------------------
 # Dashboard
 # --------------------------
 if menu == "Dashboard":
     st.title("📊 Dashboard & Analytics")
-    r = api("/students")
-    if not r or r.status_code != 200:
+    df = load_scores()
+    if df is None:
         st.info("No data or API unreachable")
         st.stop()
 
-    try:
-        df = pd.DataFrame(r.json())
-    except Exception:
-        st.error("Invalid data from API")
-        st.stop()
-
     if df.empty:
         st.info("No students available")
         st.stop()
@@ -114,13 +183,9 @@ if menu == "Dashboard":
 # --------------------------
 elif menu == "View Students":
     st.title("All Students")
-    r = api("/students")
-    if r and r.status_code == 200:
-        try:
-            df = pd.DataFrame(r.json())
-        except Exception:
-            st.error("Invalid data from API")
-            st.stop()
+    rows = load_students()
+    if rows is not None:
+        df = pd.DataFrame(sorted(rows.values(), key=lambda row: row["id"]))
 
         st.dataframe(df)
         sid = st.number_input("Open student ID", min_value=1, step=1)
@@ -129,10 +194,11 @@ elif menu == "View Students":
             if not student.empty:
                 s = student.iloc[0]
                 st.json(s.to_dict())
-                if s.get("photo"):
-                    try:
-                        st.image(base64.b64decode(s["photo"]), width=200)
-                    except Exception:
+                if s.get("photo_url"):
+                    photo = api(s["photo_url"])
+                    if photo is not None and photo.status_code == 200:
+                        st.image(photo.content, width=200)
+                    else:
                         st.warning("Failed to load photo")
             else:
                 st.info("No student found with that ID")
@@ -170,13 +236,9 @@ elif menu == "Add Student":
 # --------------------------
 elif menu == "Update Student":
     st.title("✏️ Update Student")
-    r = api("/students")
-    if r and r.status_code == 200:
-        try:
-            df = pd.DataFrame(r.json())
-        except Exception:
-            st.error("Invalid data from API")
-            st.stop()
+    rows = load_students()
+    if rows is not None:
+        df = pd.DataFrame(sorted(rows.values(), key=lambda row: row["id"]))
 
         sid = st.selectbox("Select Student ID", df['id'].tolist())
         student = df[df['id'] == sid].iloc[0]
@@ -208,13 +270,9 @@ elif menu == "Update Student":
 # --------------------------
 elif menu == "Upload Photo":
     st.title("📷 Upload Student Photo")
-    r = api("/students")
-    if r and r.status_code == 200:
-        try:
-            df = pd.DataFrame(r.json())
-        except Exception:
-            st.error("Invalid data from API")
-            st.stop()
+    rows = load_students()
+    if rows is not None:
+        df = pd.DataFrame(sorted(rows.values(), key=lambda row: row["id"]))
 
         if not df.empty:
             sid = st.selectbox("Select Student", df['id'].tolist())
@@ -260,13 +318,9 @@ elif menu == "Predict Grade":
 # --------------------------
 elif menu == "Insights":
     st.title("🔍 Student Insights")
-    r = api("/students")
-    if r and r.status_code == 200:
-        try:
-            df = pd.DataFrame(r.json())
-        except Exception:
-            st.error("Invalid data from API")
-            st.stop()
+    rows = load_students()
+    if rows is not None:
+        df = pd.DataFrame(sorted(rows.values(), key=lambda row: row["id"]))
 
         sid = st.selectbox("Select Student ID", df['id'].tolist())
         if st.button("Get Insights"):
@@ -286,21 +340,20 @@ elif menu == "Insights":
 # --------------------------
 elif menu == "Export CSV":
     st.title("📥 Export Students Data")
-    r = api("/students")
-    if r and r.status_code == 200:
+    fmt = st.selectbox("Format", ["csv", "ndjson", "parquet"])
+    if st.button("Prepare Export"):
+        # server streams the export, no need to rebuild it from /students here
         try:
-            df = pd.DataFrame(r.json())
-        except Exception:
-            st.error("Invalid data from API")
-            st.stop()
-
-        if not df.empty:
-            csv_data = df.to_csv(index=False).encode('utf-8')
-            st.download_button("Download CSV", csv_data, "students.csv", "text/csv")
-        else:
-            st.info("No students available to export")
-    else:
-        st.error("Failed to fetch students")
+            r = requests.get(f"{st.session_state['API_URL']}/students/export",
+                             params={"format": fmt}, timeout=300)
+        except Exception as e:
+            r = None
+            st.error(f"API error: {e}")
+        if r is not None and r.status_code == 200:
+            st.download_button(f"Download {fmt.upper()}", r.content, f"students.{fmt}",
+                               r.headers.get("content-type", "application/octet-stream"))
+        elif r is not None:
+            st.error(r.text or "Failed to export students")
 
 # --------------------------
 # Settings
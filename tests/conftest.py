@@ -0,0 +1,33 @@
+# tests/conftest.py
+# main binds its engines and stores at import, so point them at a scratch
+# directory before any test imports it.
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="students-api-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'students.db')}"
+os.environ["PHOTO_STORE_DIR"] = os.path.join(_tmp, "photos")
+os.environ["MODEL_DIR"] = os.path.join(_tmp, "models")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+os.environ.pop("RESPONSE_CACHE_BACKEND", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+    import models
+    from database import engine
+
+    with TestClient(main.app) as c:
+        yield c
+    with engine.begin() as conn:
+        for table in reversed(models.db.metadata.sorted_tables):
+            conn.execute(table.delete())
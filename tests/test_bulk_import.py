@@ -0,0 +1,50 @@
+# tests/test_bulk_import.py
+def _student(i, **overrides):
+    row = {
+        "name": f"Student {i}", "email": f"student{i}@example.com", "age": 20, "course": "Physics",
+        "math": 70, "science": 80, "english": 90, "attendance": 95,
+    }
+    row.update(overrides)
+    return row
+
+
+def test_bulk_json_inserts_rows(client):
+    r = client.post("/students/bulk", json=[_student(i) for i in range(3)])
+    assert r.status_code == 200
+    assert r.json() == {"inserted": 3, "failed": 0, "errors": []}
+
+    students = client.get("/students").json()
+    assert len(students) == 3
+    assert {s["name"] for s in students} == {"Student 0", "Student 1", "Student 2"}
+    assert all(s["total"] == 240 and s["grade"] == "A" for s in students)
+
+
+def test_bulk_reports_bad_rows_and_keeps_good_ones(client):
+    rows = [
+        _student(1),
+        {k: v for k, v in _student(2).items() if k != "age"},
+        {k: v for k, v in _student(3).items() if k != "email"},
+        _student(1, name="Duplicate"),
+        _student(4),
+    ]
+    body = client.post("/students/bulk", json=rows).json()
+    assert body["inserted"] == 2
+    assert [e["row"] for e in body["errors"]] == [2, 3, 4]
+    assert "age" in body["errors"][0]["error"]
+    assert "email" in body["errors"][1]["error"]
+    assert "Duplicate email" in body["errors"][2]["error"]
+    assert len(client.get("/students").json()) == 2
+
+
+def test_bulk_csv_inserts_rows(client):
+    csv_body = (
+        "name,email,age,course,math,science,english,attendance\n"
+        "Ann,ann@example.com,19,Maths,90,90,90,99\n"
+        "Ben,ben@example.com,,Maths,50,50,50,80\n"
+    )
+    r = client.post("/students/bulk", content=csv_body, headers={"content-type": "text/csv"})
+    body = r.json()
+    assert body["inserted"] == 1
+    assert body["errors"][0]["row"] == 2
+    [ann] = client.get("/students").json()
+    assert ann["name"] == "Ann" and ann["grade"] == "A+"
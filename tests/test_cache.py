@@ -0,0 +1,57 @@
+# tests/test_cache.py
+import asyncio
+import threading
+
+from cache import LRUCache, ResponseCache, SqliteCache
+
+
+class RecordingSqliteCache(SqliteCache):
+    """Notes which thread each call to the shared tier ran on."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl, tags=()):
+        self.threads.append(threading.get_ident())
+        super().set(key, value, ttl, tags)
+
+    def invalidate_tags(self, tags):
+        self.threads.append(threading.get_ident())
+        super().invalidate_tags(tags)
+
+
+def test_async_handlers_keep_shared_io_off_the_event_loop(tmp_path):
+    shared = RecordingSqliteCache(str(tmp_path / "cache.db"))
+    cache = ResponseCache(LRUCache(), shared, ttl=60)
+
+    async def run():
+        await cache.aset("k", b"v", ["student:1"])
+        cache.local.clear()
+        assert await cache.aget("k") == b"v"
+        # what a crud write run through AsyncSession.run_sync does
+        cache.invalidate("student:1")
+        await asyncio.gather(*cache._pending)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+
+    assert len(shared.threads) == 3
+    assert loop_thread not in shared.threads
+    assert shared.get("k") is None
+    assert cache.stats()["shared_hits"] == 1
+
+
+def test_invalidate_outside_a_loop_is_synchronous(tmp_path):
+    shared = SqliteCache(str(tmp_path / "cache.db"))
+    cache = ResponseCache(LRUCache(), shared, ttl=60)
+    cache.set("k", b"v", ["student:1"])
+
+    cache.invalidate("student:1")
+
+    assert cache.get("k") is None
+    assert shared.get("k") is None
@@ -0,0 +1,66 @@
+# tests/test_leaderboard.py
+from sqlalchemy import update
+
+import crud
+import models
+from database import SessionLocal
+
+
+def _student(i, score):
+    return {
+        "name": f"Student {i}", "email": f"student{i}@example.com", "age": 20, "course": "Physics",
+        "math": score, "science": score, "english": score, "attendance": 95,
+    }
+
+
+def _add(client, i, score):
+    assert client.post("/students/bulk", json=[_student(i, score)]).json()["inserted"] == 1
+
+
+def test_rank_follows_own_writes(client):
+    _add(client, 1, 50)
+    _add(client, 2, 60)
+    low = client.get("/students").json()[0]["id"]
+    assert client.get(f"/students/{low}/rank").json()["overall"]["rank"] == 2
+
+    assert client.put(f"/students/{low}", json=_student(1, 90)).status_code == 200
+    assert client.get(f"/students/{low}/rank").json()["overall"]["rank"] == 1
+
+
+def test_rank_sees_writes_from_other_processes(client):
+    _add(client, 1, 50)
+    _add(client, 2, 60)
+    low = client.get("/students").json()[0]["id"]
+    assert client.get(f"/students/{low}/rank").json()["overall"]["rank"] == 2
+
+    # what another worker's update leaves behind: new row and table version, no local delta
+    with SessionLocal() as db:
+        db.execute(update(models.Student).where(models.Student.id == low).values(total=300))
+        crud.bump_table_version(db)
+        db.commit()
+
+    assert client.get(f"/students/{low}/rank").json()["overall"]["rank"] == 1
+
+
+def test_concurrent_rank_lookups_on_a_cold_index(client):
+    import asyncio
+
+    import httpx
+
+    import leaderboard
+    import main
+
+    assert client.post("/students/bulk", json=[_student(i, i % 100) for i in range(2000)]).json()["inserted"] == 2000
+    ids = [s["id"] for s in client.get("/students", params={"limit": 5}).json()]
+    leaderboard.board.reset()
+
+    async def lookups():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            # the index is built while the other lookups wait on it
+            return await asyncio.gather(*(http.get(f"/students/{i}/rank") for i in ids))
+
+    # waited on from this thread: a deadlocked event loop can't time itself out
+    responses = client.portal.start_task_soon(lookups).result(timeout=30)
+    assert [r.status_code for r in responses] == [200] * len(ids)
+    assert all(r.json()["overall"]["out_of"] == 2000 for r in responses)
@@ -0,0 +1,68 @@
+# tests/test_migrations.py
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+import migrations
+import models
+
+# the student table as the first release created it
+BASELINE_STUDENT = """
+CREATE TABLE student (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    age INTEGER NOT NULL,
+    course VARCHAR(100) NOT NULL,
+    math FLOAT,
+    science FLOAT,
+    english FLOAT,
+    total FLOAT,
+    grade VARCHAR(2),
+    attendance FLOAT,
+    photo BLOB
+)
+"""
+
+
+def _baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(BASELINE_STUDENT))
+        conn.execute(text(
+            "INSERT INTO student (name, email, age, course, math, science, english, total, grade, attendance) "
+            "VALUES ('Old Row', 'old@example.com', 20, 'CS', 80, 80, 80, 240, 'A', 95)"
+        ))
+    return engine
+
+
+def test_upgrade_adds_missing_columns_and_keeps_rows(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    models.db.metadata.create_all(bind=engine)
+
+    added = migrations.upgrade(engine)
+
+    assert len(added) == len(migrations.STEPS)
+    columns = {c["name"] for c in inspect(engine).get_columns("student")}
+    assert set(models.Student.__table__.c.keys()) <= columns
+    indexes = {i["name"] for i in inspect(engine).get_indexes("student")}
+    assert {"ix_student_total", "ix_student_course_total"} <= indexes
+    with Session(engine) as db:
+        student = db.query(models.Student).one()
+        assert student.email == "old@example.com"
+        assert student.photo_hash is None
+        assert student.version == 1
+        assert student.updated_at is None
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    migrations.upgrade(engine)
+
+    assert migrations.upgrade(engine) == []
+
+
+def test_upgrade_on_fresh_database_does_nothing(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    models.db.metadata.create_all(bind=engine)
+
+    assert migrations.upgrade(engine) == []
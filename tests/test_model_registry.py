@@ -0,0 +1,38 @@
+# tests/test_model_registry.py
+import json
+import os
+
+import pytest
+
+import model_registry
+
+
+@pytest.mark.parametrize("version", ["", "..", "../models", "a/../b", "..\\evil", "/tmp/x", ".tmp-123", "nope"])
+def test_load_rejects_versions_not_in_the_registry(tmp_path, version):
+    # a pickle outside the registry must never be opened
+    (tmp_path / "evil").mkdir()
+    (tmp_path / "evil" / "meta.json").write_text(json.dumps({"version": "evil"}))
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+
+    with pytest.raises(ValueError):
+        model_registry.Predictor.load(version, str(model_dir))
+    with pytest.raises(ValueError):
+        model_registry.ModelRegistry(str(model_dir)).activate(version)
+    assert not os.path.exists(model_dir / "ACTIVE")
+
+
+def test_activate_known_version(tmp_path):
+    meta = {"version": "20260101000000"}
+    model_registry.save({"weights": [1, 2, 3]}, meta, str(tmp_path))
+
+    predictor = model_registry.ModelRegistry(str(tmp_path)).activate(meta["version"])
+
+    assert predictor.version == meta["version"]
+    assert model_registry.active_version(str(tmp_path)) == meta["version"]
+
+
+def test_model_changes_require_admin(client):
+    assert client.post("/model/train").status_code == 403
+    assert client.post("/model/activate/anything").status_code == 403
+    assert client.get("/model/info").status_code == 200
@@ -0,0 +1,61 @@
+# tests/test_read_your_writes.py
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, select
+
+import database
+from database import ReadYourWritesMiddleware, RoutingSession, replica_reads
+
+
+T = Table("t", MetaData(), Column("x", Integer))
+
+
+def _app(tmp_path, monkeypatch):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    T.create(primary)
+    monkeypatch.setattr(RoutingSession, "_engines", lambda self: (primary, [replica]))
+    monkeypatch.setattr(database, "_last_write", 0.0)
+
+    def session():
+        with RoutingSession() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.post("/write")
+    def write(db=Depends(session)):
+        db.execute(T.insert().values(x=1))
+        db.commit()
+
+    @app.get("/read")
+    def read(db=Depends(session)):
+        with replica_reads(db):
+            return {"primary": db.get_bind(clause=select(1)) is primary}
+
+    app.add_middleware(ReadYourWritesMiddleware)
+    return app
+
+
+def test_only_the_writing_client_reads_from_the_primary(tmp_path, monkeypatch):
+    app = _app(tmp_path, monkeypatch)
+    writer, other = TestClient(app), TestClient(app)
+    # each client's first response gives it the cookie
+    assert writer.get("/read").json() == {"primary": False}
+    assert other.get("/read").json() == {"primary": False}
+
+    r = writer.post("/write")
+    assert float(r.headers[database.LAST_WRITE_HEADER]) > 0
+
+    assert writer.get("/read").json() == {"primary": True}
+    assert other.get("/read").json() == {"primary": False}
+
+
+def test_header_carries_the_last_write(tmp_path, monkeypatch):
+    app = _app(tmp_path, monkeypatch)
+    client = TestClient(app)
+    last_write = client.post("/write").headers[database.LAST_WRITE_HEADER]
+    client.cookies.clear()
+
+    assert client.get("/read", headers={database.LAST_WRITE_HEADER: last_write}).json() == {"primary": True}
+    assert client.get("/read", headers={database.LAST_WRITE_HEADER: "0"}).json() == {"primary": False}
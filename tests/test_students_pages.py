@@ -0,0 +1,20 @@
+# tests/test_students_pages.py
+def test_cursor_walks_every_student(client):
+    rows = [{
+        "name": f"Student {i}", "email": f"student{i}@example.com", "age": 20, "course": "Physics",
+        "math": 70, "science": 80, "english": 90, "attendance": 95,
+    } for i in range(250)]
+    assert client.post("/students/bulk", json=rows).json()["inserted"] == 250
+
+    first = client.get("/students")
+    assert len(first.json()) == 100
+
+    seen, cursor = [], None
+    while True:
+        r = client.get("/students", params={"limit": 100, **({"cursor": cursor} if cursor else {})})
+        seen += [s["id"] for s in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 250
+    assert seen == sorted(seen)